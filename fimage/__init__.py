@@ -1,4 +1,5 @@
-from .converters import hsv2rgb, rgb2hsv
+from .cache import DiskCache, MemoryCache
+from .converters import hsv2rgb, hsv2rgb_float32, rgb2hsv, rgb2hsv_float32, rotate_hue
 from .filters import *
 from .fimage import FImage
 from .image_array import ImageArray
@@ -7,16 +8,28 @@ from .presets import *
 __all__ = [
     "rgb2hsv",
     "hsv2rgb",
+    "rgb2hsv_float32",
+    "hsv2rgb_float32",
+    "rotate_hue",
     "FImage",
+    "MemoryCache",
+    "DiskCache",
     "ImageArray",
+    "AutoContrast",
+    "AutoLevels",
+    "AutoWhiteBalance",
+    "BoxBlur",
     "Brightness",
     "Channels",
     "Clip",
     "Colorize",
+    "ColorMatrix",
     "Contrast",
     "Curves",
+    "Edges",
     "Exposure",
     "Gamma",
+    "GaussianBlur",
     "Grayscale",
     "FillColor",
     "Hue",
@@ -25,7 +38,11 @@ __all__ = [
     "Posterize",
     "Saturation",
     "Sepia",
+    "Sharpen",
+    "SwapChannels",
+    "UnsharpMask",
     "Vibrance",
+    "Vignette",
     "Love",
     "OrangePeel",
     "SinCity",
@@ -0,0 +1,149 @@
+"""Run FImage work from asyncio code without blocking the event loop.
+
+Decoding, filtering and encoding run in an executor, by default the event
+loop's own thread pool, and files are read and written there too. Set
+EXECUTOR to use another one everywhere, and LIMITER to a MegapixelLimiter to
+bound the size of the images processed at the same time. NumPy, OpenCV and
+Pillow release the GIL while they work, so threads keep the event loop
+responsive while they run.
+"""
+
+import asyncio
+import collections
+import io
+import os
+from typing import Callable, Optional
+
+# Executor running the blocking work, None for the event loop's default one
+EXECUTOR = None
+
+# MegapixelLimiter shared by default by every async call, None for no limit
+LIMITER = None
+
+
+class MegapixelLimiter:
+    """Bound the megapixels of images being decoded, filtered or encoded.
+
+    Calls wait, in the order they arrive, until the megapixels already in
+    flight plus their own fit within `megapixels`. An image larger than the
+    whole budget runs alone rather than never.
+    """
+
+    def __init__(self, megapixels: float) -> None:
+        self.megapixels = megapixels
+        # Counted in whole pixels, as sums of megapixel floats drift
+        self._budget = round(megapixels * 1e6)
+        self._in_flight = 0
+        self._waiters = collections.deque()
+
+    @property
+    def in_flight(self) -> float:
+        return self._in_flight / 1e6
+
+    def _fits(self, pixels: int) -> bool:
+        return not self._in_flight or self._in_flight + pixels <= self._budget
+
+    async def acquire(self, megapixels: float) -> None:
+        pixels = round(megapixels * 1e6)
+        if not self._waiters and self._fits(pixels):
+            self._in_flight += pixels
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((pixels, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Cancelled after being let through
+                self.release(megapixels)
+            else:
+                self._wake()
+            raise
+
+    def release(self, megapixels: float) -> None:
+        self._in_flight -= round(megapixels * 1e6)
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters:
+            pixels, waiter = self._waiters[0]
+            if waiter.done():
+                self._waiters.popleft()
+            elif self._fits(pixels):
+                self._waiters.popleft()
+                self._in_flight += pixels
+                waiter.set_result(None)
+            else:
+                return
+
+
+async def run(
+    function: Callable,
+    megapixels: float = 0,
+    executor=None,
+    limiter: Optional[MegapixelLimiter] = None,
+):
+    """Call `function` in the executor and return its result.
+
+    With a limiter, `megapixels` are held from before the call starts until
+    it ends, even when the awaiting task is cancelled meanwhile.
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or EXECUTOR
+    limiter = limiter or LIMITER
+    if limiter is None:
+        return await loop.run_in_executor(executor, function)
+
+    await limiter.acquire(megapixels)
+    try:
+        future = loop.run_in_executor(executor, function)
+    except BaseException:
+        limiter.release(megapixels)
+        raise
+    future.add_done_callback(lambda _: limiter.release(megapixels))
+    # The work goes on in its thread if the task is cancelled
+    return await asyncio.shield(future)
+
+
+def is_file(target) -> bool:
+    """Whether `target` is a path or a file object rather than in-memory data."""
+    return isinstance(target, (str, os.PathLike)) or hasattr(target, "read")
+
+
+def read_bytes(file) -> bytes:
+    if hasattr(file, "read"):
+        return file.read()
+    with open(file, "rb") as f:
+        return f.read()
+
+
+def write_bytes(file, data: bytes) -> None:
+    if hasattr(file, "write"):
+        file.write(data)
+        return
+    with open(file, "wb") as f:
+        f.write(data)
+
+
+def format_for(file) -> Optional[str]:
+    """Return the Pillow format for the extension of a path, as `save` would."""
+    from PIL import Image
+
+    if hasattr(file, "write"):
+        return None
+    Image.init()
+    extension = os.path.splitext(os.fspath(file))[1].lower()
+    return Image.registered_extensions().get(extension)
+
+
+def encoded_megapixels(data: bytes, preview: Optional[int] = None) -> float:
+    """Return the size an encoded image will have once decoded.
+
+    Only the header is parsed, which is cheap enough for the event loop.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = image.size
+    return width * height / (preview or 1) ** 2 / 1e6
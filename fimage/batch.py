@@ -0,0 +1,225 @@
+"""Apply filters to many images, in worker processes or as one stack."""
+
+import glob
+import os
+import time
+import traceback
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    as_completed,
+    wait,
+)
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+import numpy as np
+
+from fimage.class_register import ClassMapRegister
+from fimage.exceptions import FimageException
+from fimage.fimage import FImage
+from fimage.image_array import ImageArray
+from fimage.pipeline import Pipeline, compile_pipeline
+
+# Pipeline of the current worker process, built once by `_init_worker`
+_worker_pipeline = None
+
+
+class BatchResult(NamedTuple):
+    index: int
+    source: str
+    output: Optional[str]
+    # Seconds spent on each stage: "decode", "filter" and "encode"
+    timings: Dict[str, float]
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def to_specs(filters) -> List:
+    """Turn filters, presets, names or (name, args) pairs into specs.
+
+    A spec is the (name, args) pair `ClassMapRegister.get_class` accepts, which
+    is much cheaper to send to a worker process than a filter with its tables.
+    """
+    if isinstance(filters, (str, ClassMapRegister, type)):
+        filters = [filters]
+
+    specs = []
+    for filter_ in filters:
+        if isinstance(filter_, str):
+            specs.append((filter_.lower(), None))
+        elif isinstance(filter_, type) and issubclass(filter_, ClassMapRegister):
+            specs.append((filter_.__name__.lower(), None))
+        elif isinstance(filter_, ClassMapRegister):
+            specs.append(filter_.spec)
+        else:
+            name, args = filter_
+            specs.append((name.lower(), args))
+    return specs
+
+
+def build_pipeline(specs: List) -> Pipeline:
+    """Build a compiled pipeline from filter specs."""
+    return compile_pipeline(
+        [ClassMapRegister.get_class(name, args) for name, args in specs]
+    )
+
+
+def expand_sources(sources: Union[str, Iterable[str]]) -> List[str]:
+    """Expand a glob pattern, or a directory, into a sorted list of files."""
+    if not isinstance(sources, (str, os.PathLike)):
+        return [os.fspath(source) for source in sources]
+
+    sources = os.fspath(sources)
+    if os.path.isdir(sources):
+        sources = os.path.join(sources, "*")
+
+    return sorted(
+        path for path in glob.glob(sources, recursive=True) if os.path.isfile(path)
+    )
+
+
+def output_path(pattern: str, source: str, index: int) -> str:
+    """Format an output pattern for a source path.
+
+    Available fields are `{name}` (file name), `{stem}` (file name without its
+    suffix), `{suffix}` (including the dot), `{parent}` and `{index}`.
+    """
+    name = os.path.basename(source)
+    stem, suffix = os.path.splitext(name)
+    return pattern.format(
+        name=name,
+        stem=stem,
+        suffix=suffix,
+        parent=os.path.dirname(source),
+        index=index,
+    )
+
+
+def process_stack(stack, filters, dtype=None, workers: int = 1) -> np.ndarray:
+    """Filter a stack of same-sized images in a single vectorized pass.
+
+    `stack` is a (count, height, width, channels) uint8 array, or a sequence
+    of (height, width, channels) ones. The result matches filtering each image
+    on its own, without the Python overhead per image, which dominates for
+    small images such as thumbnails.
+    """
+    image_array = ImageArray(np.asarray(stack), dtype=dtype)
+    if not image_array.is_stack:
+        raise FimageException("Expected a (count, height, width, channels) stack.")
+
+    compile_pipeline(filters).process(image_array, workers=workers)
+    return image_array.get_current()
+
+
+def _init_worker(specs: List) -> None:
+    global _worker_pipeline
+    _worker_pipeline = build_pipeline(specs)
+
+
+def process_image(pipeline: Pipeline, source, output=None, **save_kwargs) -> Dict:
+    """Decode, filter and encode one image, returning the time of each stage.
+
+    `source` and `output` may be paths or binary file objects.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    image = FImage(source)
+    timings["decode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    image.apply(pipeline)
+    timings["filter"] = time.perf_counter() - start
+
+    if output is not None:
+        start = time.perf_counter()
+        if isinstance(output, str) and os.path.dirname(output):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+        image.save(output, **save_kwargs)
+        timings["encode"] = time.perf_counter() - start
+
+    return timings
+
+
+def _process_one(
+    index: int,
+    source: str,
+    output: Optional[str],
+    save_kwargs: Dict,
+    pipeline: Optional[Pipeline] = None,
+) -> BatchResult:
+    try:
+        timings = process_image(
+            pipeline or _worker_pipeline, source, output, **save_kwargs
+        )
+    except Exception:
+        return BatchResult(index, source, output, {}, traceback.format_exc())
+
+    return BatchResult(index, source, output, timings)
+
+
+def process_batch(
+    sources: Union[str, Iterable[str]],
+    filters,
+    output: Optional[str] = None,
+    workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    **save_kwargs,
+) -> Iterator[BatchResult]:
+    """Decode, filter and encode every source image.
+
+    `sources` is an iterable of paths, a glob pattern or a directory.
+    `filters` is a list of filters or presets, a preset name or a list of
+    (name, args) specs. `output` is a pattern formatted by `output_path`,
+    e.g. "out/{stem}_sepia.jpg"; when omitted images are filtered but not
+    saved.
+
+    Images are processed by `workers` processes (all CPUs by default, in the
+    calling process for 1), each of which builds the filters once. At most
+    `max_in_flight` images are queued at a time, which bounds the memory used
+    by decoded frames. Results are yielded as images finish, and a failing
+    image is reported through `BatchResult.error` without stopping the run.
+    """
+    specs = to_specs(filters)
+    tasks = (
+        (index, source, output and output_path(output, source, index))
+        for index, source in enumerate(expand_sources(sources))
+    )
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1:
+        pipeline = build_pipeline(specs)
+        for task in tasks:
+            yield _process_one(*task, save_kwargs, pipeline)
+        return
+
+    max_in_flight = max_in_flight or 2 * workers
+    with ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(specs,)
+    ) as pool:
+        pending = {}
+        for task in tasks:
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield _result(future, pending.pop(future))
+
+            future = pool.submit(_process_one, *task, save_kwargs)
+            pending[future] = task
+
+        for future in as_completed(list(pending)):
+            yield _result(future, pending.pop(future))
+
+
+def _result(future, task) -> BatchResult:
+    try:
+        return future.result()
+    except Exception:
+        # The worker itself died, e.g. killed for running out of memory
+        index, source, output = task
+        return BatchResult(index, source, output, {}, traceback.format_exc())
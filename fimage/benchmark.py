@@ -0,0 +1,282 @@
+"""Benchmark every registered filter and preset on synthetic images.
+
+Run `python -m fimage.benchmark --help`. Results are written as JSON and can
+be compared against a previous run to catch regressions:
+
+    python -m fimage.benchmark --sizes 0.3MP,12MP -o baseline.json
+    python -m fimage.benchmark --sizes 0.3MP,12MP --baseline baseline.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from fimage.class_register import ClassMapRegister
+from fimage.image_array import ImageArray
+from fimage.pipeline import compile_pipeline
+from fimage.presets import Preset
+
+# Synthetic image sizes as (height, width)
+SIZES = {
+    "0.3MP": (480, 640),
+    "2MP": (1080, 1920),
+    "12MP": (3000, 4000),
+    "50MP": (6144, 8192),
+}
+
+MODES = {"RGB": 3, "RGBA": 4}
+
+# Arguments for filters that have no defaults, or whose defaults do nothing
+ARGS = {
+    "brightness": 20,
+    "channels": ({"R": 20, "B": -10},),
+    "clip": 10,
+    "colorize": (196, 32, 7, 30),
+    "colormatrix": (((0.9, 0.1, 0, 5), (0, 1.1, -0.1, 0), (0.1, 0, 0.8, -5)),),
+    "contrast": 20,
+    "curves": ((0, 0), (100, 50), (140, 200), (255, 255)),
+    "exposure": 20,
+    "fillcolor": (10, 20, 30),
+    "gamma": 1.3,
+    "hue": 30,
+    "noise": 10,
+    "posterize": 5,
+    "saturation": 30,
+    "sepia": 90,
+    "sharpen": 50,
+    "vibrance": 30,
+}
+
+# Metrics compared by `compare`, and whether higher values are better
+METRICS = {"mp_per_s": True, "peak_bytes": False}
+
+
+def parse_size(size: str) -> Tuple[int, int]:
+    """Return (height, width) for a name in SIZES or a `WIDTHxHEIGHT` string."""
+    if size in SIZES:
+        return SIZES[size]
+    width, height = (int(value) for value in size.lower().split("x"))
+    return height, width
+
+
+def registered_names() -> List[str]:
+    """Names of every filter and preset that can be instantiated."""
+    import inspect
+
+    return sorted(
+        name
+        for name, cls in ClassMapRegister.class_map.items()
+        if not inspect.isabstract(cls) and cls is not Preset
+    )
+
+
+def synthetic_image(size: Tuple[int, int], channels: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size + (channels,), dtype=np.uint8)
+
+
+def time_stages(stages, ndarray: np.ndarray, dtype=None) -> List[float]:
+    """Run the stages on a copy of the image and return each one's seconds."""
+    image_array = ImageArray(ndarray.copy(), dtype=dtype)
+    seconds = []
+    for stage in stages:
+        start = time.perf_counter()
+        stage.process(image_array)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def peak_bytes(stages, ndarray: np.ndarray, dtype=None) -> int:
+    """Peak bytes allocated while running the stages, excluding the input."""
+    image_array = ImageArray(ndarray.copy(), dtype=dtype)
+    tracemalloc.start()
+    try:
+        for stage in stages:
+            stage.process(image_array)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def benchmark(
+    name: str,
+    ndarray: np.ndarray,
+    repeat: int = 3,
+    dtype=None,
+) -> Dict:
+    """Time one filter or preset on an image, keeping the best of `repeat` runs."""
+    stages = compile_pipeline([ClassMapRegister.get_class(name, ARGS.get(name))]).stages
+    # The first run builds lookup tables and warms caches
+    time_stages(stages, ndarray, dtype)
+    runs = [time_stages(stages, ndarray, dtype) for _ in range(repeat)]
+    best = min(runs, key=sum)
+    megapixels = ndarray.shape[0] * ndarray.shape[1] / 1e6
+
+    return {
+        "name": name,
+        "width": ndarray.shape[1],
+        "height": ndarray.shape[0],
+        "mode": "RGBA" if ndarray.shape[-1] == 4 else "RGB",
+        "megapixels": megapixels,
+        "seconds": sum(best),
+        "mp_per_s": megapixels / max(sum(best), 1e-9),
+        "peak_bytes": peak_bytes(stages, ndarray, dtype),
+        "stages": [
+            {"stage": repr(stage), "seconds": seconds}
+            for stage, seconds in zip(stages, best)
+        ],
+    }
+
+
+def run(
+    names: Optional[Iterable[str]] = None,
+    sizes: Iterable[str] = tuple(SIZES),
+    modes: Iterable[str] = tuple(MODES),
+    repeat: int = 3,
+    dtype=None,
+    progress=None,
+) -> Dict:
+    """Benchmark every filter and preset in `names` (all by default).
+
+    `progress` is called with each result as it is measured.
+    """
+    names = list(names or registered_names())
+    results = []
+    for size in sizes:
+        for mode in modes:
+            ndarray = synthetic_image(parse_size(size), MODES[mode])
+            for name in names:
+                result = {"size": size, **benchmark(name, ndarray, repeat, dtype)}
+                results.append(result)
+                if progress:
+                    progress(result)
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "dtype": None if dtype is None else np.dtype(dtype).name,
+        "results": results,
+    }
+
+
+def compare(report: Dict, baseline: Dict, threshold: float = 0.1) -> List[Dict]:
+    """Return the results that got worse than the baseline by over `threshold`.
+
+    Throughput and peak allocations are compared for every (name, size, mode)
+    found in both reports.
+    """
+
+    def key(result):
+        return result["name"], result["size"], result["mode"]
+
+    previous = {key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+
+        for metric, higher_is_better in METRICS.items():
+            if not old[metric]:
+                continue
+            change = result[metric] / old[metric] - 1
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(
+                    {
+                        "name": result["name"],
+                        "size": result["size"],
+                        "mode": result["mode"],
+                        "metric": metric,
+                        "baseline": old[metric],
+                        "value": result[metric],
+                        "change": change,
+                    }
+                )
+    return regressions
+
+
+def format_result(result: Dict) -> str:
+    return (
+        f"{result['name']:<12} {result['size']:>9} {result['mode']:<4} "
+        f"{result['mp_per_s']:>9.1f} MP/s {result['peak_bytes'] / 2**20:>9.1f} MiB"
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m fimage.benchmark",
+        description="Benchmark filters and presets on synthetic images.",
+    )
+    parser.add_argument(
+        "-f",
+        "--filters",
+        help="comma separated filters and presets (default: all registered)",
+    )
+    parser.add_argument(
+        "--sizes",
+        default=",".join(SIZES),
+        help=f"comma separated sizes among {', '.join(SIZES)} or WIDTHxHEIGHT",
+    )
+    parser.add_argument(
+        "--modes", default=",".join(MODES), help="comma separated RGB and RGBA"
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument(
+        "--dtype", choices=("int16", "float32"), help="ImageArray buffer dtype"
+    )
+    parser.add_argument("-o", "--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative change reported as a regression (default: 0.1)",
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    report = run(
+        names=args.filters.split(",") if args.filters else None,
+        sizes=args.sizes.split(","),
+        modes=args.modes.split(","),
+        repeat=args.repeat,
+        dtype=args.dtype,
+        progress=lambda result: print(format_result(result), file=sys.stderr),
+    )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as file:
+        regressions = compare(report, json.load(file), args.threshold)
+    for regression in regressions:
+        print(
+            f"regression: {regression['name']} {regression['size']} "
+            f"{regression['mode']} {regression['metric']} "
+            f"{regression['baseline']:.4g} -> {regression['value']:.4g} "
+            f"({regression['change']:+.0%})",
+            file=sys.stderr,
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
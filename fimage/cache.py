@@ -0,0 +1,167 @@
+"""Caches for filtered pixels, keyed by source content and filter chain."""
+
+import abc
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+import numpy as np
+
+from fimage.pipeline import FusedStage, VibranceSaturation, flatten_filters
+
+
+def signature(filters: Iterable) -> Optional[str]:
+    """Return a deterministic signature for a chain of filters and presets.
+
+    It is built from each filter's registered name and constructor arguments,
+    so equal chains get equal signatures across processes. Returns None when a
+    filter is not deterministic, meaning its results must not be cached.
+    """
+    specs = []
+    for filter_ in flatten_filters(filters):
+        stage_filters = (
+            filter_.filters
+            if isinstance(filter_, (FusedStage, VibranceSaturation))
+            else [filter_]
+        )
+        for stage_filter in stage_filters:
+            if not stage_filter.deterministic:
+                return None
+            specs.append(stage_filter.spec)
+
+    encoded = json.dumps(specs, sort_keys=True, default=_encode_argument).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def _encode_argument(value):
+    """Encode arguments JSON does not handle without losing precision."""
+    if isinstance(value, np.ndarray):
+        return {"dtype": value.dtype.str, "values": value.tolist()}
+    if isinstance(value, np.generic):
+        return value.item()
+    return repr(value)
+
+
+def content_hash(ndarray: np.ndarray) -> str:
+    """Return a hash of the pixel values, shape and dtype of an array."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{ndarray.shape}{ndarray.dtype}".encode())
+    digest.update(np.ascontiguousarray(ndarray).data)
+    return digest.hexdigest()
+
+
+class Cache(abc.ABC):
+    """Store of filtered frames keyed by `content_hash` and `signature`."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(source_hash: str, chain_signature: str) -> str:
+        return f"{source_hash}-{chain_signature}"
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            ndarray = self._get(key)
+            if ndarray is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return ndarray
+
+    def put(self, key: str, ndarray: np.ndarray) -> None:
+        if ndarray.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._put(key, ndarray)
+
+    @abc.abstractmethod
+    def _get(self, key: str) -> Optional[np.ndarray]:
+        """"""
+
+    @abc.abstractmethod
+    def _put(self, key: str, ndarray: np.ndarray) -> None:
+        """"""
+
+
+class MemoryCache(Cache):
+    """Least recently used in-memory cache holding up to `max_bytes`."""
+
+    def __init__(self, max_bytes: int = 256 * 2**20) -> None:
+        super().__init__(max_bytes)
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def _get(self, key: str) -> Optional[np.ndarray]:
+        ndarray = self._entries.get(key)
+        if ndarray is None:
+            return None
+        self._entries.move_to_end(key)
+        return ndarray.copy()
+
+    def _put(self, key: str, ndarray: np.ndarray) -> None:
+        if key in self._entries:
+            self.size -= self._entries.pop(key).nbytes
+
+        self._entries[key] = ndarray.copy()
+        self.size += ndarray.nbytes
+
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.nbytes
+
+
+class DiskCache(Cache):
+    """Directory of .npy files, evicting the least recently used past `max_bytes`.
+
+    Files are written atomically, so several processes can share a directory.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 2**30) -> None:
+        super().__init__(max_bytes)
+        self.directory = os.fspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def _get(self, key: str) -> Optional[np.ndarray]:
+        path = self.path(key)
+        try:
+            ndarray = np.load(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        # The modification time orders the entries for eviction
+        os.utime(path)
+        return ndarray
+
+    def _put(self, key: str, ndarray: np.ndarray) -> None:
+        path = self.path(key)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as file:
+            np.save(file, ndarray)
+        os.replace(temporary, path)
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
@@ -0,0 +1,86 @@
+"""Frames kept after each step of an FImage, for re-rendering and undo."""
+
+import os
+import shutil
+import tempfile
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class Checkpoints:
+    """Frames keyed by the number of filters applied to produce them.
+
+    Frames stay in memory up to `max_bytes`. Past that the oldest ones are
+    spilled to memory-mapped files in a temporary directory, which is created
+    on the first spill and removed by `close`.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 2**20) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.directory = None
+        self._frames: Dict[int, np.ndarray] = {}
+
+    def __contains__(self, count: int) -> bool:
+        return count in self._frames
+
+    def __del__(self) -> None:
+        self.close()
+
+    def put(self, count: int, frame: np.ndarray) -> None:
+        """Store `frame` as the result of the first `count` filters."""
+        self.discard(count)
+        self._frames[count] = frame
+        self.size += frame.nbytes
+        self.spill()
+
+    def get(self, count: int) -> np.ndarray:
+        """Return a copy of the frame stored for `count` filters."""
+        return np.array(self._frames[count])
+
+    def latest(self, count: int) -> Optional[int]:
+        """Return the highest stored count that is not above `count`."""
+        return max((key for key in self._frames if key <= count), default=None)
+
+    def discard(self, count: int) -> None:
+        frame = self._frames.pop(count, None)
+        if frame is None:
+            return
+        if isinstance(frame, np.memmap):
+            os.remove(frame.filename)
+        else:
+            self.size -= frame.nbytes
+
+    def discard_after(self, count: int) -> None:
+        """Drop the frames of every count above `count`."""
+        for key in [key for key in self._frames if key > count]:
+            self.discard(key)
+
+    def spill(self) -> None:
+        """Move the oldest in-memory frames to disk until under `max_bytes`."""
+        for count in sorted(self._frames):
+            if self.size <= self.max_bytes:
+                break
+
+            frame = self._frames[count]
+            if isinstance(frame, np.memmap):
+                continue
+
+            if self.directory is None:
+                self.directory = tempfile.mkdtemp(prefix="fimage-")
+            path = os.path.join(self.directory, f"{count}.raw")
+            spilled = np.memmap(path, dtype=frame.dtype, mode="w+", shape=frame.shape)
+            spilled[...] = frame
+            spilled.flush()
+
+            self._frames[count] = spilled
+            self.size -= frame.nbytes
+
+    def close(self) -> None:
+        """Drop every frame and remove the spill directory."""
+        self._frames.clear()
+        self.size = 0
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
@@ -1,4 +1,7 @@
+from typing import Any, Tuple
+
 from fimage.exceptions import FilterException
+from fimage.instrumentation import instrumented
 
 
 class ClassMapRegister:
@@ -8,10 +11,23 @@ class ClassMapRegister:
 
     class_map = {}
 
+    def __new__(cls, *args, **kwargs):
+        instance = super().__new__(cls)
+        # Keep the constructor arguments so the instance can be rebuilt by name
+        instance._args = (args, kwargs)
+        return instance
+
     def __init_subclass__(cls, **kwargs) -> None:
         super().__init_subclass__(**kwargs)
         ClassMapRegister.class_map[cls.__name__.lower()] = cls
 
+        # Let `fimage.instrumentation` measure filters and presets
+        process = cls.__dict__.get("process")
+        if isinstance(process, classmethod):
+            cls.process = classmethod(instrumented(process.__func__))
+        elif callable(process) and not getattr(process, "__isabstractmethod__", False):
+            cls.process = instrumented(process)
+
     @classmethod
     def get_class(cls, cls_name, args):
         cls_name = cls_name.lower()
@@ -29,3 +45,19 @@ class ClassMapRegister:
             cls_name = cls.class_map.get(cls_name)(args)
 
         return cls_name
+
+    @property
+    def spec(self) -> Tuple[str, Any]:
+        """Return a (name, args) pair that `get_class` turns into an equal object."""
+        cls_name = type(self).__name__.lower()
+        args, kwargs = getattr(self, "_args", ((), {}))
+
+        if kwargs:
+            import inspect
+
+            bound = inspect.signature(type(self)).bind(*args, **kwargs)
+            return cls_name, dict(bound.arguments)
+        elif args:
+            return cls_name, tuple(args)
+
+        return cls_name, None
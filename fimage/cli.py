@@ -0,0 +1,204 @@
+"""Command line interface: `fimage [INPUT ...] --filter NAME=ARGS -o OUTPUT`."""
+
+import argparse
+import io
+import json
+import os
+import sys
+from typing import Any, List, Optional, Tuple
+
+from fimage.batch import build_pipeline, expand_sources, process_batch, process_image
+from fimage.class_register import ClassMapRegister
+from fimage.exceptions import FimageException
+
+STAGES = ("decode", "filter", "encode")
+
+
+def parse_number(value: str):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def parse_args_value(value: str) -> Any:
+    """Parse the part after `=` in `--filter NAME=VALUE`.
+
+    `20` gives a single argument, `196,32,7,30` positional arguments and
+    `0:0,100:50` a tuple of points. JSON is accepted as well: a list is used as
+    positional arguments and an object as keyword arguments.
+    """
+    if value[:1] in "[{":
+        parsed = json.loads(value)
+        return tuple(parsed) if isinstance(parsed, list) else parsed
+
+    items = []
+    for item in value.split(","):
+        if ":" in item:
+            items.append(tuple(parse_number(part) for part in item.split(":")))
+        else:
+            items.append(parse_number(item))
+
+    return items[0] if len(items) == 1 else tuple(items)
+
+
+def parse_filter(value: str) -> Tuple[str, Any]:
+    name, _, args = value.partition("=")
+    name = name.strip().lower()
+    if name not in ClassMapRegister.class_map:
+        raise argparse.ArgumentTypeError(f"unknown filter or preset `{name}`")
+
+    try:
+        return name, parse_args_value(args) if args else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid arguments `{args}` for `{name}`")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="fimage",
+        description="Apply filters and presets to images.",
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        default=["-"],
+        help="image files, directories or glob patterns, `-` reads from stdin",
+    )
+    parser.add_argument(
+        "-f",
+        "--filter",
+        "-p",
+        "--preset",
+        dest="filters",
+        action="append",
+        type=parse_filter,
+        default=[],
+        metavar="NAME[=ARGS]",
+        help="filter or preset to apply, in the order given, e.g. contrast=20",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="-",
+        help=(
+            "output path pattern with {name}, {stem}, {suffix}, {parent} and "
+            "{index} fields, `-` writes to stdout (default)"
+        ),
+    )
+    parser.add_argument(
+        "--format", help="image format for stdout, e.g. JPEG (default: input format)"
+    )
+    parser.add_argument("-q", "--quality", type=int, help="encoder quality")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes (default: 1)",
+    )
+    parser.add_argument(
+        "--bench",
+        action="store_true",
+        help="print decode, filter and encode timings to stderr",
+    )
+    return parser
+
+
+def print_timings(label: str, timings: dict) -> None:
+    stages = "  ".join(
+        f"{stage}={timings[stage] * 1000:.1f}ms" for stage in STAGES if stage in timings
+    )
+    print(f"{label}: {stages}", file=sys.stderr)
+
+
+def run_stream(args: argparse.Namespace, pipeline, save_kwargs: dict) -> int:
+    """Filter one image read from stdin, or from a single file, to stdout."""
+    from PIL import Image, UnidentifiedImageError
+
+    source = args.inputs[0]
+    label = "stdin" if source == "-" else source
+    if source == "-":
+        source = io.BytesIO(sys.stdin.buffer.read())
+
+    # Decoding and encoding errors are reported in one line, like failures of
+    # single files in `run_files`
+    try:
+        if args.format is None:
+            # Keep the input format, Pillow cannot guess it from a stream
+            with Image.open(source) as image:
+                save_kwargs["format"] = image.format
+            if not isinstance(source, str):
+                source.seek(0)
+
+        timings = process_image(pipeline, source, sys.stdout.buffer, **save_kwargs)
+        sys.stdout.buffer.flush()
+    except UnidentifiedImageError:
+        print(f"fimage: {label}: cannot identify image", file=sys.stderr)
+        return 1
+    except (OSError, ValueError, FimageException) as exc:
+        print(f"fimage: {label}: {exc}", file=sys.stderr)
+        return 1
+
+    if args.bench:
+        print_timings(label, timings)
+    return 0
+
+
+def run_files(args: argparse.Namespace, save_kwargs: dict) -> int:
+    sources = []
+    for pattern in args.inputs:
+        sources.extend(expand_sources(pattern))
+
+    failures = 0
+    totals = dict.fromkeys(STAGES, 0.0)
+    results = process_batch(
+        sources, args.filters, args.output, workers=args.jobs, **save_kwargs
+    )
+    for result in results:
+        if not result.ok:
+            failures += 1
+            print(f"fimage: {result.source}: failed\n{result.error}", file=sys.stderr)
+            continue
+
+        if args.bench:
+            print_timings(result.source, result.timings)
+            for stage, seconds in result.timings.items():
+                totals[stage] += seconds
+
+    if args.bench:
+        print_timings(f"total ({len(sources)} images, {args.jobs} jobs)", totals)
+    return 1 if failures else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    save_kwargs = {}
+    if args.format:
+        save_kwargs["format"] = args.format
+    if args.quality is not None:
+        save_kwargs["quality"] = args.quality
+
+    try:
+        pipeline = build_pipeline(args.filters)
+    except (TypeError, ValueError, ArithmeticError, FimageException) as exc:
+        parser.error(f"invalid filter arguments: {exc}")
+
+    if args.output == "-":
+        if len(args.inputs) != 1:
+            parser.error("writing to stdout needs exactly one input")
+        if args.inputs[0] != "-" and not os.path.isfile(args.inputs[0]):
+            parser.error(
+                f"writing to stdout needs an image file, `{args.inputs[0]}` is not one"
+            )
+        return run_stream(args, pipeline, save_kwargs)
+
+    if "-" in args.inputs:
+        parser.error("reading from stdin needs `-o -`")
+    return run_files(args, save_kwargs)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,5 @@
+from typing import Optional
+
 import numpy as np
 
 
@@ -68,3 +70,97 @@ def hsv2rgb(hsv: np.ndarray) -> np.ndarray:
     rgb[s == 0.0] = np.hstack([v, v, v])[s == 0.0]
 
     return rgb.reshape(input_shape)
+
+
+def _channels_float32(rgb: np.ndarray):
+    return [rgb[..., index].astype(np.float32) for index in range(3)]
+
+
+def _hue(r: np.ndarray, g: np.ndarray, b: np.ndarray, max_array, delta):
+    """Return the hue of float32 channels scaled to [0, 6).
+
+    Numerators are offset by 2 * delta and 4 * delta instead of adding 2 and
+    4 after the division, so a single masked divide handles grey pixels.
+    """
+    hue = np.subtract(g, b)
+    np.putmask(hue, max_array == g, b - r + 2 * delta)
+    np.putmask(hue, max_array == b, r - g + 4 * delta)
+    np.divide(hue, delta, out=hue, where=delta > 0)
+    hue[hue < 0] += 6
+    return hue
+
+
+def _sector_weight(hue: np.ndarray, n: int, out: np.ndarray) -> np.ndarray:
+    """Return clip(min(k, 4 - k), 0, 1) with k = (n + hue) % 6.
+
+    A channel value is then max - (max - min) * weight, which is the usual
+    HSV to RGB conversion without selecting one of six sectors per pixel.
+    """
+    np.add(hue, n, out=out)
+    np.remainder(out, 6, out=out)
+    np.minimum(out, 4 - out, out=out)
+    return np.clip(out, 0, 1, out=out)
+
+
+def rgb2hsv_float32(rgb: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """float32 version of `rgb2hsv`, optionally writing into `out`."""
+    if out is None:
+        out = np.empty(rgb.shape[:-1] + (3,), dtype=np.float32)
+
+    r, g, b = _channels_float32(rgb)
+    max_array = np.maximum(np.maximum(r, g), b)
+    delta = max_array - np.minimum(np.minimum(r, g), b)
+
+    out[..., 0] = _hue(r, g, b, max_array, delta)
+    out[..., 0] /= 6
+    out[..., 1] = 0
+    np.divide(delta, max_array, out=out[..., 1], where=max_array > 0)
+    np.divide(max_array, 255, out=out[..., 2])
+    return out
+
+
+def hsv2rgb_float32(hsv: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """float32 version of `hsv2rgb`, optionally writing into `out`."""
+    if out is None:
+        out = np.empty(hsv.shape, dtype=np.float32)
+
+    h, s, v = _channels_float32(hsv)
+    h *= 6
+    # The difference between max and min
+    s *= v
+    weight = np.empty_like(h)
+    for index, n in enumerate((5, 3, 1)):
+        _sector_weight(h, n, weight)
+        weight *= s
+        np.subtract(v, weight, out=out[..., index])
+    return out
+
+
+def rotate_hue(
+    rgb: np.ndarray, shift: float, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Rotate the hue of RGB values by `shift` turns, e.g. 0.5 for 180 degrees.
+
+    Saturation and value do not change, so each pixel keeps its max and min
+    and only the hue is computed, instead of going through a full HSV array.
+    Returns float32 values in [0, 255].
+    """
+    if out is None:
+        out = np.empty(rgb.shape[:-1] + (3,), dtype=np.float32)
+
+    r, g, b = _channels_float32(rgb)
+    max_array = np.maximum(np.maximum(r, g), b)
+    delta = np.minimum(np.minimum(r, g), b)
+    np.subtract(max_array, delta, out=delta)
+
+    hue = _hue(r, g, b, max_array, delta)
+    hue += shift * 6
+    np.remainder(hue, 6, out=hue)
+
+    # The channels are not needed anymore
+    weight = r
+    for index, n in enumerate((5, 3, 1)):
+        _sector_weight(hue, n, weight)
+        weight *= delta
+        np.subtract(max_array, weight, out=out[..., index])
+    return out
@@ -1,23 +1,109 @@
 """Color filters."""
 
 import abc
+import copy
+import functools
 import math
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 
-import cv2
 import numpy as np
 
 from fimage.class_register import ClassMapRegister
-from fimage.converters import hsv2rgb, rgb2hsv
-from fimage.image_array import ImageArray
+from fimage.converters import rotate_hue
+from fimage.exceptions import FilterException
+from fimage.image_array import HISTOGRAM_SAMPLES, ImageArray
+from fimage.lut import IDENTITY, apply_lut, is_lut_index
 
 
 class Filter(abc.ABC, ClassMapRegister):
+    # Rows of context a filter reads above and below each output row. Filters
+    # that cannot be run on separate bands of the image set it to None.
+    halo = 0
+    # Whether equal inputs always give equal outputs, which allows caching
+    deterministic = True
+
     @abc.abstractmethod
     def process(self, image_array: ImageArray) -> None:
         """"""
 
 
+class PointFilter(Filter):
+    """Filter whose output for a channel value depends only on that value.
+
+    Point filters implement `transform` over a (3, ...) stack of R, G and B
+    values, which lets the pipeline compiler run several of them in a single
+    pass over the pixels. Evaluating `transform` on every possible value gives
+    the filter's lookup table, used whenever the channels hold integers.
+    """
+
+    _lut = None
+
+    @abc.abstractmethod
+    def transform(self, channels: np.ndarray) -> np.ndarray:
+        """Return the transformed channels as int16 values in [0, 255]."""
+
+    @property
+    def lut(self) -> np.ndarray:
+        """3x256 uint8 table mapping each channel value to its new value."""
+        if self._lut is None:
+            values = IDENTITY.astype(np.int16)
+            self._lut = self.transform(values).astype(np.uint8)
+        return self._lut
+
+    def process(self, image_array: ImageArray) -> None:
+        R, G, B = image_array.R, image_array.G, image_array.B
+        if all(is_lut_index(channel) for channel in (R, G, B)):
+            channels = apply_lut(self.lut, R, G, B, out=image_array.buffer)
+        else:
+            channels = self.transform(np.array([R, G, B]))
+        image_array.R, image_array.G, image_array.B = channels
+
+
+def _constrain(channels: np.ndarray) -> np.ndarray:
+    """Truncate channel values to int16 and clip them to [0, 255]."""
+    channels = channels.astype(np.int16)
+    np.clip(channels, 0, 255, out=channels)
+    return channels
+
+
+def _as_uint8(channels: np.ndarray) -> np.ndarray:
+    """Cast channel values the same way `ImageArray.get_current` does."""
+    return channels.astype(np.uint8).astype(np.int16)
+
+
+# Fractional bits of the weights used in fixed-point mode
+FIXED_POINT_BITS = 16
+
+
+def _fixed_point(image_array: ImageArray) -> bool:
+    """Whether fixed-point mode is on and the channels hold integers it can use."""
+    return image_array.fixed_point and all(
+        is_lut_index(channel)
+        for channel in (image_array.R, image_array.G, image_array.B)
+    )
+
+
+def _fixed_weighted_sum(
+    image_array: ImageArray, weights: Tuple, name: str, offset: float = 0
+):
+    """Compute floor(R * wr + G * wg + B * wb + offset) in int32 with scaled
+    weights."""
+    shape = image_array.original_array.shape[:-1]
+    out = image_array.scratch(name, shape, np.int32)
+    term = image_array.scratch("fixed_term", shape, np.int32)
+    scaled = [round(weight * 2**FIXED_POINT_BITS) for weight in weights]
+
+    np.multiply(image_array.R, scaled[0], out=out, dtype=np.int32)
+    np.multiply(image_array.G, scaled[1], out=term, dtype=np.int32)
+    out += term
+    np.multiply(image_array.B, scaled[2], out=term, dtype=np.int32)
+    out += term
+    if offset:
+        out += round(offset * 2**FIXED_POINT_BITS)
+    np.right_shift(out, FIXED_POINT_BITS, out=out)
+    return out
+
+
 class FillColor(Filter):
     def __init__(self, R: int, G: int, B: int) -> None:
         self.R = R
@@ -30,65 +116,167 @@ class FillColor(Filter):
         image_array.B = self.B
 
 
-class Sepia(Filter):
-    def __init__(self, adjust: int = 100) -> None:
-        self.adjust = adjust / 100
+# Fraction of the largest possible value added by ColorMatrix before
+# truncating, well above float32 rounding error
+COLOR_MATRIX_NUDGE = 2**-20
+
+
+class ColorMatrix(Filter):
+    """Replace R, G and B with a linear mix of them, in a single pass.
+
+    `matrix` has a row per new channel, each with the weights of R, G and B
+    and an optional fourth offset column. Every new channel is computed from
+    the original R, G and B, then truncated and clipped to [0, 255] like the
+    other filters.
+    """
+
+    def __init__(self, matrix) -> None:
+        matrix = np.array(matrix, dtype=np.float64)
+        if matrix.shape == (3, 3):
+            matrix = np.hstack([matrix, np.zeros((3, 1))])
+        if matrix.shape != (3, 4):
+            shape = "x".join(map(str, matrix.shape))
+            raise FilterException(f"Color matrix must be 3x3 or 3x4, not {shape}.")
+        self.matrix = matrix
+
+    @property
+    def stays_in_range(self) -> bool:
+        """Whether every channel value in [0, 255] is mapped into [0, 255]."""
+        weights, offset = self.matrix[:, :3], self.matrix[:, 3]
+        low = offset + 255 * np.minimum(weights, 0).sum(axis=1)
+        high = offset + 255 * np.maximum(weights, 0).sum(axis=1)
+        return bool(low.min() >= 0 and high.max() <= 255)
+
+    def compose(self, other: "ColorMatrix") -> "ColorMatrix":
+        """Return one matrix applying this one, then `other`.
+
+        The values in between are neither truncated nor clipped. When this
+        matrix `stays_in_range` only the truncation is skipped, and the result
+        is within a unit or two of applying both filters in turn.
+        """
+        weights = other.matrix[:, :3] @ self.matrix[:, :3]
+        offset = other.matrix[:, :3] @ self.matrix[:, 3] + other.matrix[:, 3]
+        return ColorMatrix(np.hstack([weights, offset[:, None]]).tolist())
 
     def process(self, image_array: ImageArray) -> None:
-        image_array.R = (
-            image_array.R * (1 - (0.607 * self.adjust))
-            + (image_array.G * (0.769 * self.adjust))
-            + (image_array.B * (0.189 * self.adjust))
+        if _fixed_point(image_array) and self._fits_int32():
+            self._process_fixed(image_array)
+            return
+
+        # Equal rows, as in Grayscale, are computed once
+        rows, indexes = np.unique(self.matrix, axis=0, return_inverse=True)
+        shape = image_array.original_array.shape[:-1]
+        channels = image_array.scratch("color_matrix", (3,) + shape, np.float32)
+        channels[0] = image_array.R
+        channels[1] = image_array.G
+        channels[2] = image_array.B
+
+        # A single matrix product over every pixel
+        result = image_array.scratch(
+            "color_matrix_out", (len(rows),) + shape, np.float32
         )
-        image_array.G = (
-            (image_array.R * (0.349 * self.adjust))
-            + (image_array.G * (1 - (0.314 * self.adjust)))
-            + (image_array.B * (0.168 * self.adjust))
+        np.matmul(
+            rows[:, :3].astype(np.float32),
+            channels.reshape(3, -1),
+            out=result.reshape(len(rows), -1),
         )
-        image_array.B = (
-            (image_array.R * (0.272 * self.adjust))
-            + (image_array.G * (0.534 * self.adjust))
-            + (image_array.B * (1 - (0.869 * self.adjust)))
+        # The product's rounding error depends on where pixels are in the
+        # array. Nudging every value up by more than that error makes
+        # truncation give the same result everywhere, and exact integers,
+        # e.g. white through Grayscale, are no longer truncated to one less.
+        bound = 255 * np.abs(rows[:, :3]).sum(axis=1) + np.abs(rows[:, 3])
+        nudge = rows[:, 3] + bound * COLOR_MATRIX_NUDGE
+        result += nudge.astype(np.float32).reshape((-1,) + (1,) * len(shape))
+
+        # Clip, then truncate while casting to the channels' dtype
+        indexes = indexes.ravel()
+        out = image_array.buffer
+        if out is None:
+            out = np.empty(result.shape, dtype=np.int16)
+            np.clip(result, 0, 255, out=out, casting="unsafe")
+            image_array.R, image_array.G, image_array.B = (out[i] for i in indexes)
+            return
+
+        for channel, index in zip(out, indexes):
+            np.clip(result[index], 0, 255, out=channel, casting="unsafe")
+        if out.dtype.kind == "f":
+            np.trunc(out, out=out)
+        image_array.R, image_array.G, image_array.B = out
+
+    def _fits_int32(self) -> bool:
+        bound = 255 * np.abs(self.matrix[:, :3]).sum(axis=1) + np.abs(self.matrix[:, 3])
+        return bool(bound.max() * 2**FIXED_POINT_BITS < 2**31)
+
+    def _process_fixed(self, image_array: ImageArray) -> None:
+        results = {}
+        for index, row in enumerate(map(tuple, self.matrix)):
+            if row not in results:
+                results[row] = _fixed_weighted_sum(
+                    image_array, row[:3], f"color_matrix_{index}", row[3]
+                )
+        image_array.R, image_array.G, image_array.B = (
+            results[tuple(row)] for row in self.matrix
         )
         image_array.constrain_channels()
 
 
-class Contrast(Filter):
+class Sepia(ColorMatrix):
+    def __init__(self, adjust: int = 100) -> None:
+        self.adjust = adjust / 100
+        # G is defined from the new R, and B from the new R and G
+        r, g, b = np.array(
+            [
+                [1 - (0.607 * self.adjust), 0.769 * self.adjust, 0.189 * self.adjust],
+                [0.349 * self.adjust, 1 - (0.314 * self.adjust), 0.168 * self.adjust],
+                [0.272 * self.adjust, 0.534 * self.adjust, 1 - (0.869 * self.adjust)],
+            ]
+        )
+        # Expressed in terms of the original R, G and B
+        g = g[0] * r + g * [0, 1, 1]
+        b = b[0] * r + b[1] * g + b * [0, 0, 1]
+        super().__init__([r, g, b])
+
+
+class Grayscale(ColorMatrix):
+    weights = (0.299, 0.587, 0.114)
+
+    def __init__(self) -> None:
+        super().__init__([self.weights] * 3)
+
+
+class SwapChannels(ColorMatrix):
+    """Rearrange channels, e.g. "BGR" swaps red and blue and "GGG" copies green."""
+
+    def __init__(self, order: str = "BGR") -> None:
+        if len(order) != 3 or not set(order.upper()) <= set("RGB"):
+            raise FilterException(f"Channel order `{order}` is not valid.")
+        self.order = order.upper()
+        super().__init__(
+            [[float(name == source) for name in "RGB"] for source in self.order]
+        )
+
+
+class Contrast(PointFilter):
     def __init__(self, adjust: int = 100) -> None:
         self.adjust = math.pow((adjust + 100) / 100, 2)
 
-    def process(self, image_array: ImageArray) -> None:
-        image_array.R = image_array.R / 255
-        image_array.R -= 0.5
-        image_array.R *= self.adjust
-        image_array.R += 0.5
-        image_array.R *= 255
-
-        image_array.G = image_array.G / 255
-        image_array.G -= 0.5
-        image_array.G *= self.adjust
-        image_array.G += 0.5
-        image_array.G *= 255
-
-        image_array.B = image_array.B / 255
-        image_array.B -= 0.5
-        image_array.B *= self.adjust
-        image_array.B += 0.5
-        image_array.B *= 255
-        image_array.constrain_channels()
+    def transform(self, channels: np.ndarray) -> np.ndarray:
+        channels = channels / 255
+        channels -= 0.5
+        channels *= self.adjust
+        channels += 0.5
+        channels *= 255
+        return _constrain(channels)
 
 
-class Brightness(Filter):
+class Brightness(PointFilter):
     def __init__(self, adjust: int = 0) -> None:
         self.adjust = math.floor(255 * (adjust / 100))
 
-    def process(self, image_array: ImageArray) -> None:
-        ndarray = image_array.get_current().astype(np.int16)
-        ndarray += self.adjust
-        image_array.R = ndarray[..., 0]
-        image_array.G = ndarray[..., 1]
-        image_array.B = ndarray[..., 2]
-        image_array.constrain_channels()
+    def transform(self, channels: np.ndarray) -> np.ndarray:
+        channels = _as_uint8(channels)
+        channels += self.adjust
+        return _constrain(channels)
 
 
 class Saturation(Filter):
@@ -96,21 +284,10 @@ class Saturation(Filter):
         self.adjust = adjust * -0.01
 
     def process(self, image_array: ImageArray) -> None:
-        ndarray = image_array.get_current()
-        axis = ndarray.ndim - 1
+        ndarray = image_array.get_current_rgb(image_array.scratch_frame(rgb=True))
+        max_array = _max_channel(image_array, ndarray)
 
-        max_array = ndarray.max(axis=axis)
-        max_array = np.repeat(max_array, 3).reshape(ndarray.shape)
-
-        sat_array = np.where(
-            ndarray != max_array,
-            ndarray + (max_array - ndarray) * self.adjust,
-            ndarray,
-        )
-        image_array.R = sat_array[..., 0]
-        image_array.G = sat_array[..., 1]
-        image_array.B = sat_array[..., 2]
-        image_array.constrain_channels()
+        _move_towards_max(image_array, ndarray, max_array, self.adjust)
 
 
 class Vibrance(Filter):
@@ -118,37 +295,141 @@ class Vibrance(Filter):
         self.adjust = adjust * -1
 
     def process(self, image_array: ImageArray) -> None:
-        ndarray = image_array.get_current_rgb()
-
-        axis = ndarray.ndim - 1
-
-        max_array = ndarray.max(axis=axis)
-        max_array = np.repeat(max_array, 3).reshape(ndarray.shape)
-
-        avg_array = np.mean(ndarray, axis=axis, dtype=np.uint8)
-        avg_array = np.repeat(avg_array, 3).reshape(ndarray.shape)
-
-        amt_array = (((max_array - avg_array) * 2 / 255) * self.adjust) / 100
+        ndarray = image_array.get_current_rgb(image_array.scratch_frame(rgb=True))
+        max_array = _max_channel(image_array, ndarray)
 
-        vib_array = np.where(
-            ndarray != max_array,
-            ndarray + (max_array - ndarray) * amt_array,
+        _move_towards_max(
+            image_array,
             ndarray,
+            max_array,
+            self.amounts(image_array, ndarray, max_array),
         )
-        image_array.R = vib_array[..., 0]
-        image_array.G = vib_array[..., 1]
-        image_array.B = vib_array[..., 2]
-        image_array.constrain_channels()
 
+    def amounts(self, image_array: ImageArray, ndarray, max_array) -> np.ndarray:
+        """Return how far each pixel moves towards its largest channel."""
+        # Same as np.mean(ndarray, axis=-1, dtype=np.uint8), which sums in
+        # uint8, wrapping around, before dividing
+        avg_array = image_array.scratch("average", max_array.shape, np.uint8)
+        np.add(ndarray[..., 0], ndarray[..., 1], out=avg_array)
+        avg_array += ndarray[..., 2]
+        avg_array //= 3
+
+        # Same uint8 arithmetic as (max - avg) * 2, done in place
+        amt_array = np.subtract(max_array, avg_array, out=avg_array)
+        amt_array *= 2
+        amounts = image_array.scratch("vibrance", amt_array.shape, np.float32)
+        np.multiply(amt_array, np.float32(self.adjust / 100 / 255), out=amounts)
+        return amounts
+
+    @property
+    def keeps_max(self) -> bool:
+        """Whether the largest channel of every pixel stays the largest.
+
+        Pixels move towards it by at most its distance, or away from it.
+        """
+        return self.adjust <= 100
+
+
+def _max_channel(image_array: ImageArray, ndarray: np.ndarray) -> np.ndarray:
+    """Return ndarray.max(axis=-1) for an RGB frame, with elementwise maximums
+    that are much faster than reducing over the short last axis."""
+    max_array = image_array.scratch("max", ndarray.shape[:-1], ndarray.dtype)
+    np.maximum(ndarray[..., 0], ndarray[..., 1], out=max_array)
+    np.maximum(max_array, ndarray[..., 2], out=max_array)
+    return max_array
+
+
+# Pixels per np.take call in `_move_towards_max`
+MOVE_CHUNK = 1 << 18
+
+
+@functools.lru_cache(maxsize=64)
+def _move_table(amount: float, dtype) -> np.ndarray:
+    """Return the read-only table of value + (max - value) * amount, truncated
+    and clipped, at index max * 256 + value."""
+    maximum = np.arange(256.0)[:, None]
+    value = np.arange(256.0)
+    table = np.clip(np.trunc(value + (maximum - value) * amount), 0, 255)
+    table = table.ravel().astype(dtype)
+    table.flags.writeable = False
+    return table
+
+
+def _move_towards_max(image_array: ImageArray, ndarray, max_array, *amounts) -> None:
+    """Set RGB to ndarray + (max_array - ndarray) * amount, then constrain.
+
+    With several amounts each step starts from the constrained result of the
+    previous one, as when filters are applied in turn, which is only correct
+    as long as no step changes the largest channel.
+
+    Channels equal to the maximum have a zero difference, so they keep their
+    value without having to be masked out.
+    """
+    # Bound the scaled products to int32
+    if (
+        image_array.fixed_point
+        and len(amounts) == 1
+        and np.ndim(amounts[0]) == 0
+        and abs(amounts[0]) < 64
+    ):
+        scaled = round(amounts[0] * 2**FIXED_POINT_BITS)
+        for index, name in enumerate("RGB"):
+            channel = ndarray[..., index]
+            diff = image_array.scratch("diff", channel.shape, np.uint8)
+            np.subtract(max_array, channel, out=diff)
+            result = image_array.scratch("moved_fixed", channel.shape, np.int32)
+            np.multiply(diff, scaled, out=result, dtype=np.int32)
+            # floor(channel + x) is channel + floor(x) for an integer channel
+            np.right_shift(result, FIXED_POINT_BITS, out=result)
+            result += channel
+            setattr(image_array, name, result)
 
-class Grayscale(Filter):
-    def process(self, image_array: ImageArray) -> None:
-        avg = (
-            (0.299 * image_array.R) + (0.587 * image_array.G) + (0.114 * image_array.B)
-        )
-        image_array.R = avg
-        image_array.G = avg
-        image_array.B = avg
+        image_array.constrain_channels()
+        return
+
+    # Channels are moved one at a time, and each result is constrained
+    # straight into the channels' storage. Per-pixel amounts, as in Vibrance,
+    # are moved in a float32 work array. A single amount, as in Saturation,
+    # goes through a table indexed by the maximum and the channel value,
+    # which holds the exact float64 results.
+    out = image_array.buffer
+    if out is None:
+        out = np.empty((3,) + max_array.shape, dtype=np.int16)
+    shape = max_array.shape
+    if any(np.ndim(amount) for amount in amounts):
+        moved = image_array.scratch("moved", shape, np.float32)
+    if not all(np.ndim(amount) for amount in amounts):
+        keys = image_array.scratch("moved_keys", shape, np.uint16)
+    if len(amounts) > 1:
+        moved_step = image_array.scratch("moved_step", shape, np.uint8)
+
+    for index in range(3):
+        value = ndarray[..., index]
+        for step, amount in enumerate(amounts):
+            target = out[index] if step == len(amounts) - 1 else moved_step
+            if np.ndim(amount):
+                np.subtract(max_array, value, out=moved, dtype=np.float32)
+                moved *= amount
+                moved += value
+                # Casting truncates
+                np.clip(moved, 0, 255, out=target, casting="unsafe")
+            else:
+                np.left_shift(max_array, 8, out=keys, dtype=np.uint16)
+                keys |= value
+                table = _move_table(amount, target.dtype)
+                # np.take converts indexes to intp, which a chunk at a time
+                # keeps small. Targets are contiguous, so these are views.
+                keys_flat, target_flat = keys.reshape(-1), target.reshape(-1)
+                for start in range(0, keys_flat.size, MOVE_CHUNK):
+                    chunk = slice(start, start + MOVE_CHUNK)
+                    np.take(
+                        table, keys_flat[chunk], out=target_flat[chunk], mode="clip"
+                    )
+            value = target
+
+    if out.dtype.kind == "f":
+        np.trunc(out, out=out)
+    image_array.R, image_array.G, image_array.B = out
 
 
 class Hue(Filter):
@@ -156,90 +437,128 @@ class Hue(Filter):
         self.adjust = abs(adjust)
 
     def process(self, image_array: ImageArray) -> None:
-        ndarray = image_array.get_current_rgb()
-        hsv = rgb2hsv(ndarray)
-        h = hsv[..., 0]
-        h *= 100
-        h += self.adjust
-        h = h % 100
-        h = h / 100
-        hsv[..., 0] = h
-        # hsv2rgb function returns a float type with values ranging from 0 to 1
-        rgb = (hsv2rgb(hsv) * 255).astype(np.uint8)
+        ndarray = image_array.get_current_rgb(image_array.scratch_frame(rgb=True))
+        rgb = image_array.scratch("hue", ndarray.shape, np.float32)
+        rotate_hue(ndarray, (self.adjust % 100) / 100, out=rgb)
+        # Round rather than truncate, so that float error does not take one
+        # off values that land exactly on an integer
+        np.rint(rgb, out=rgb)
         image_array.R = rgb[..., 0]
         image_array.G = rgb[..., 1]
         image_array.B = rgb[..., 2]
         image_array.constrain_channels()
 
 
-class Colorize(Filter):
+class Colorize(PointFilter):
     def __init__(self, R: int, G: int, B: int, level: int) -> None:
         self.R = R
         self.G = G
         self.B = B
         self.level = level
 
-    def process(self, image_array: ImageArray) -> None:
-        image_array.R = image_array.R - (image_array.R - self.R) * (self.level / 100)
-        image_array.G = image_array.G - (image_array.G - self.G) * (self.level / 100)
-        image_array.B = image_array.B - (image_array.B - self.B) * (self.level / 100)
-        image_array.constrain_channels()
+    def transform(self, channels: np.ndarray) -> np.ndarray:
+        color = np.array([self.R, self.G, self.B])
+        color = color.reshape((3,) + (1,) * (channels.ndim - 1))
+        return _constrain(channels - (channels - color) * (self.level / 100))
 
 
-class Invert(Filter):
-    def process(self, image_array: ImageArray) -> None:
-        image_array.R = 255 - image_array.R
-        image_array.G = 255 - image_array.G
-        image_array.B = 255 - image_array.B
-        image_array.constrain_channels()
+class Invert(PointFilter):
+    def transform(self, channels: np.ndarray) -> np.ndarray:
+        return _constrain(255 - channels)
 
 
-class Gamma(Filter):
+class Gamma(PointFilter):
     def __init__(self, adjust: int = 1) -> None:
         self.adjust = adjust
 
-    def process(self, image_array: ImageArray) -> None:
-        image_array.R = ((image_array.R / 255) ** self.adjust) * 255
-        image_array.G = ((image_array.G / 255) ** self.adjust) * 255
-        image_array.B = ((image_array.B / 255) ** self.adjust) * 255
-        image_array.constrain_channels()
+    def transform(self, channels: np.ndarray) -> np.ndarray:
+        return _constrain(((channels / 255) ** self.adjust) * 255)
 
 
-class Noise(Filter):
-    def __init__(self, adjust: int = 1) -> None:
-        self.adjust = abs(adjust) * 2.55
+# Rows of noise drawn from each key of the counter-based generator
+NOISE_BLOCK_ROWS = 64
 
-    def process(self, image_array: ImageArray) -> None:
-        # Generate a random array and sum it up with our current one
-        random_array = np.random.randint(
-            -self.adjust, self.adjust, image_array.original_array.shape
-        )
-        ndarray = image_array.get_current()
-        ndarray = ndarray + random_array
 
-        image_array.R = ndarray[..., 0]
-        image_array.G = ndarray[..., 1]
-        image_array.B = ndarray[..., 2]
+class Noise(Filter):
+    """Add uniform random values to R, G and B; alpha is left unchanged.
 
-        image_array.constrain_channels()
+    Noise is drawn with Philox, a counter-based generator, keyed by the seed
+    and by the position of each block of NOISE_BLOCK_ROWS rows in the image,
+    so any band or tile draws the same values as the whole image would. With
+    a `seed` results are reproducible whatever the number of workers, and
+    can be cached. Every frame of a stack gets the noise it would get alone.
 
+    Without a seed every frame draws a new key from NumPy's global random
+    state, in order, so the whole image is processed at once for
+    `np.random.seed` to keep results reproducible.
+    """
 
-class Clip(Filter):
-    def __init__(self, adjust: int = 1) -> None:
+    def __init__(self, adjust: int = 1, seed: Optional[int] = None) -> None:
         self.adjust = abs(adjust) * 2.55
+        self.seed = seed
+        self.deterministic = seed is not None
+        self.halo = 0 if self.deterministic else None
+
+    def _key(self) -> int:
+        if self.seed is None:
+            return int(np.random.randint(0, 2**63, dtype=np.int64))
+        seed = np.random.SeedSequence(self.seed)
+        return int(seed.generate_state(1, np.uint64)[0])
 
     def process(self, image_array: ImageArray) -> None:
-        ndarray = image_array.get_current()
+        # Same bounds as np.random.randint(-adjust, adjust)
+        low, high = int(-self.adjust), int(self.adjust)
+        if high <= low:
+            return
+
+        frame = image_array.get_current_rgb(image_array.scratch_frame(rgb=True))
+        frames = frame if image_array.is_stack else frame[None]
+        noise = image_array.scratch("noise", frames.shape, np.int16)
+        first_row = 0 if image_array.is_stack else image_array.row_offset
+        if self.seed is None:
+            keys = [self._key() for _ in noise]
+        else:
+            keys = [self._key()] * len(noise)
+
+        rows = frames.shape[1]
+        for key, out in zip(keys, noise):
+            start = first_row
+            while start < first_row + rows:
+                block = start // NOISE_BLOCK_ROWS
+                generator = np.random.Generator(np.random.Philox(key=[key, block]))
+                block_start = block * NOISE_BLOCK_ROWS
+                stop = min(block_start + NOISE_BLOCK_ROWS, first_row + rows)
+                values = generator.integers(
+                    low,
+                    high,
+                    (stop - block_start,) + out.shape[1:],
+                    dtype=np.int16,
+                )
+                out[start - first_row : stop - first_row] = values[
+                    start - block_start :
+                ]
+                start = stop
+
+        noise = noise.reshape(frame.shape)
+        noise += frame
+        np.clip(noise, 0, 255, out=noise)
+        image_array.R, image_array.G, image_array.B = (
+            noise[..., index] for index in range(3)
+        )
 
-        ndarray = np.where(ndarray > 255 - self.adjust, 255, ndarray)
-        ndarray = np.where(ndarray < self.adjust, 0, ndarray)
 
-        image_array.R = ndarray[..., 0]
-        image_array.G = ndarray[..., 1]
-        image_array.B = ndarray[..., 2]
+class Clip(PointFilter):
+    def __init__(self, adjust: int = 1) -> None:
+        self.adjust = abs(adjust) * 2.55
+
+    def transform(self, channels: np.ndarray) -> np.ndarray:
+        channels = _as_uint8(channels)
+        channels[channels > 255 - self.adjust] = 255
+        channels[channels < self.adjust] = 0
+        return channels
 
 
-class Channels(Filter):
+class Channels(PointFilter):
     def __init__(self, channels: Dict = {}) -> None:
         self.R = channels.get("R")
         self.G = channels.get("G")
@@ -254,139 +573,432 @@ class Channels(Filter):
         if self.B:
             self.B /= 100
 
-    def process(self, image_array: ImageArray) -> None:
-        if self.R is not None:
-            if self.R > 0:
-                image_array.R = image_array.R + (255 - image_array.R) * self.R
-            else:
-                image_array.R = image_array.R + (255 - image_array.R) * abs(self.R)
+    def transform(self, channels: np.ndarray) -> np.ndarray:
+        result = channels.astype(np.float64)
+        for index, adjust in enumerate((self.R, self.G, self.B)):
+            if adjust is not None:
+                channel = channels[index]
+                result[index] = channel + (255 - channel) * abs(adjust)
 
-        if self.G is not None:
-            if self.G > 0:
-                image_array.G = image_array.G + (255 - image_array.G) * self.G
-            else:
-                image_array.G = image_array.G + (255 - image_array.G) * abs(self.G)
+        return _constrain(result)
 
-        if self.B is not None:
-            if self.B > 0:
-                image_array.B = image_array.B + (255 - image_array.B) * self.B
-            else:
-                image_array.B = image_array.B + (255 - image_array.B) * abs(self.B)
 
-        image_array.constrain_channels()
+# Points at which Bezier curves are evaluated
+CURVE_STEPS = 1000
 
 
-class Curves(Filter):
-    def __init__(self, p0: Tuple, p1: Tuple, p2: Tuple, p3: Tuple) -> None:
-        self.p0 = p0
-        self.p1 = p1
-        self.p2 = p2
-        self.p3 = p3
-        self.curve = self.calculate_bezier(1000)
+def _bezier_points(
+    points: Tuple[Tuple[float, float], ...], steps: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Sample the Bezier curve of `points` at `steps` steps.
 
-    def clip(self, x: int) -> int:
-        if x < 0:
-            return 0
-
-        if x > 255:
-            return 255
+    Returns the x coordinates in [0, 255] the curve reaches, in increasing
+    order, with the y value of the last step rounding to each.
+    """
+    degree = len(points) - 1
+    t = np.arange(steps) / steps
+    x = np.zeros(steps)
+    y = np.zeros(steps)
+    # Bernstein polynomials, in the order of the cubic formula they extend
+    for k, (px, py) in enumerate(points):
+        binomial = math.factorial(degree) // (
+            math.factorial(k) * math.factorial(degree - k)
+        )
+        weight = binomial * (1 - t) ** (degree - k) * t**k
+        x += weight * px
+        y += weight * py
+
+    x = np.rint(x)
+    y = np.rint(np.clip(y, 0, 255))
+    inside = (x >= 0) & (x <= 255)
+    # The last step reaching each x value wins
+    keys, last = np.unique(x[inside][::-1], return_index=True)
+    return keys, y[inside][::-1][last]
+
+
+def _fill_table(keys, values) -> np.ndarray:
+    """Return the 256 entry table of `values` at `keys`, linearly
+    interpolating the x values in between."""
+    return np.rint(np.interp(np.arange(256), keys, values)).astype(np.uint8)
+
+
+@functools.lru_cache(maxsize=256)
+def _curve_table(
+    points: Tuple[Tuple[float, float], ...], steps: int = CURVE_STEPS
+) -> np.ndarray:
+    """Sample the Bezier curve of `points` into a read-only 256 entry table.
+
+    The curve is evaluated at 1000 steps, values are taken at the rounded x
+    coordinates, later steps winning, and x values the curve skips are
+    linearly interpolated.
+    """
+    table = _fill_table(*_bezier_points(points, steps))
+    table.flags.writeable = False
+    return table
+
+
+class Curves(PointFilter):
+    """Tone curve given by the control points of a Bezier curve.
+
+    Any number of (x, y) points, at least two, can be given as arguments or as
+    a single list. Four points give the usual cubic curve, and can also be
+    given as the `p0` to `p3` keyword arguments.
+    """
+
+    def __init__(
+        self,
+        *points,
+        p0: Optional[Tuple] = None,
+        p1: Optional[Tuple] = None,
+        p2: Optional[Tuple] = None,
+        p3: Optional[Tuple] = None,
+    ) -> None:
+        keywords = (p0, p1, p2, p3)
+        if any(point is not None for point in keywords):
+            if points or any(point is None for point in keywords):
+                raise FilterException(
+                    "Curves takes either points or all of p0, p1, p2 and p3."
+                )
+            points = keywords
+        elif len(points) == 1 and np.ndim(points[0]) == 2:
+            points = points[0]
+
+        points = tuple(tuple(float(value) for value in point) for point in points)
+        if len(points) < 2 or any(len(point) != 2 for point in points):
+            raise FilterException("Curves needs at least two (x, y) points.")
+
+        self.points = points
+        if len(points) == 4:
+            self.p0, self.p1, self.p2, self.p3 = points
+        self.table = _curve_table(points).astype(np.int16)
+
+    @property
+    def curve(self) -> Dict:
+        """Mapping of every value in [0, 255] to its new value."""
+        return dict(enumerate(self.table.tolist()))
 
-        return x
+    def calculate_bezier(self, granuality: int) -> Dict:
+        """Return `curve` for the curve evaluated at `granuality` steps."""
+        return dict(enumerate(_curve_table(self.points, granuality).tolist()))
 
     def missing_values(self, curve: Dict) -> Dict:
-        max_value = 256
+        """Return `curve` with the values in [0, 255] it lacks interpolated."""
+        keys = sorted(curve)
+        values = [curve[key] for key in keys]
+        return dict(enumerate(_fill_table(keys, values).tolist()))
 
-        if len(curve.keys()) < max_value:
-            # Some values might be missed, we need to add them
-            right_value = None
-            left_value = None
+    def transform(self, channels: np.ndarray) -> np.ndarray:
+        return self.table[channels.astype(np.uint8)]
 
-            for index in range(max_value):
-                if index not in curve.keys():
-                    left_value = curve.get(index - 1)
-                    for i in range(index, max_value):
-                        if i in curve.keys():
-                            right_value = curve.get(i)
-                            break
 
-                    if left_value is not None and right_value is not None:
-                        curve[index] = round((left_value + right_value) / 2)
+class Exposure(PointFilter):
+    def __init__(self, adjust: int = 1) -> None:
+        self.adjust = abs(adjust) / 100
+        self.p1 = (0, self.adjust * 255)
+        self.p2 = (255 - (self.adjust * 255), 255)
+        self.curves = Curves((0, 0), self.p1, self.p2, (255, 255))
 
-                    if left_value is None:
-                        curve[index] = right_value
+    def transform(self, channels: np.ndarray) -> np.ndarray:
+        return self.curves.transform(channels)
 
-                    if right_value is None:
-                        curve[index] = left_value
 
-        return curve
+class Posterize(PointFilter):
+    def __init__(self, adjust) -> None:
+        self.num_areas = 256 / adjust
+        self.num_values = 255 / (adjust - 1)
 
-    def calculate_bezier(self, granuality: int) -> Dict:
-        result = dict()
-
-        for i in range(granuality):
-            t = i / granuality
-            x = (
-                (1 - t) ** 3 * self.p0[0]
-                + 3 * (1 - t) ** 2 * t * self.p1[0]
-                + 3 * (1 - t) * t ** 2 * self.p2[0]
-                + t ** 3 * self.p3[0]
+    def transform(self, channels: np.ndarray) -> np.ndarray:
+        channels = _as_uint8(channels)
+        return _constrain(np.floor(channels / self.num_areas) * self.num_values)
+
+
+class HistogramFilter(Filter):
+    """Filter whose lookup table is derived from the image's own histograms.
+
+    Subclasses implement `table` over the (3, 256) counts given by
+    `ImageArray.histograms`, sampling up to `samples` pixels. The table for an
+    image, from `lut_for`, composes with the tables of point filters, e.g.
+    `compose_luts([AutoLevels().lut_for(image_array), Curves(...).lut])`.
+
+    The histograms describe the whole image, so these filters are not run on
+    bands, and each frame of a stack gets its own table. `with_histograms`
+    fixes the histograms instead, e.g. to those of a whole image processed
+    in tiles.
+    """
+
+    halo = None
+    _histograms = None
+
+    def __init__(self, samples: Optional[int] = HISTOGRAM_SAMPLES) -> None:
+        self.samples = samples
+
+    @abc.abstractmethod
+    def table(self, histograms: np.ndarray) -> np.ndarray:
+        """Return the 3x256 uint8 table for the given histograms."""
+
+    def lut_for(self, image_array: ImageArray) -> np.ndarray:
+        """3x256 uint8 table mapping each channel value of the image."""
+        histograms = self._histograms
+        if histograms is None:
+            histograms = image_array.histograms(self.samples)
+        return self.table(histograms)
+
+    def with_histograms(self, histograms: np.ndarray) -> "HistogramFilter":
+        """Return a copy using `histograms` for every image, which can be run
+        on bands."""
+        fixed = copy.copy(self)
+        fixed._histograms = histograms
+        fixed.halo = 0
+        return fixed
+
+    def process(self, image_array: ImageArray) -> None:
+        R, G, B = image_array.R, image_array.G, image_array.B
+        if not all(is_lut_index(channel) for channel in (R, G, B)):
+            # Read values the same way get_current and histograms do
+            R, G, B = np.array(np.broadcast_arrays(R, G, B)).astype(np.uint8)
+            image_array.R, image_array.G, image_array.B = R, G, B
+
+        if not image_array.is_stack:
+            channels = apply_lut(
+                self.lut_for(image_array), R, G, B, out=image_array.buffer
             )
-            y = (
-                (1 - t) ** 3 * self.p0[1]
-                + 3 * (1 - t) ** 2 * t * self.p1[1]
-                + 3 * (1 - t) * t ** 2 * self.p2[1]
-                + t ** 3 * self.p3[1]
+            image_array.R, image_array.G, image_array.B = channels
+            return
+
+        shape = image_array.original_array.shape[:-1]
+        channels = image_array.buffer
+        if channels is None:
+            channels = np.empty((3,) + shape, dtype=np.int16)
+        tables = [
+            self.lut_for(image_array.band(index, index + 1))
+            for index in range(shape[0])
+        ]
+        for index, table in enumerate(tables):
+            frame = (
+                channel[index] if np.ndim(channel) == len(shape) else channel
+                for channel in (R, G, B)
             )
+            apply_lut(table, *frame, out=channels[:, index])
+        image_array.R, image_array.G, image_array.B = channels
 
-            result[round(x)] = round(self.clip(y))
 
-        result = self.missing_values(result)
+def _percentiles(histogram: np.ndarray, clip: float) -> Tuple[int, int]:
+    """Return the lowest and highest values once `clip` percent of the counts
+    are left out at each end."""
+    cumulative = np.cumsum(histogram)
+    total = cumulative[-1]
+    low = np.searchsorted(cumulative, total * clip / 100, side="right")
+    high = np.searchsorted(cumulative, total * (1 - clip / 100), side="left")
+    return int(low), int(high)
 
-        return result
 
-    def process(self, image_array: ImageArray) -> None:
-        # https://stackoverflow.com/a/16993364
-        ndarray = image_array.get_current()
+def _stretch_table(low: int, high: int) -> np.ndarray:
+    """Return the 256 entry table mapping [low, high] linearly onto [0, 255]."""
+    if high <= low:
+        return IDENTITY[0]
+    values = (np.arange(256) - low) * (255 / (high - low))
+    return np.clip(np.rint(values), 0, 255).astype(np.uint8)
 
-        u, inv = np.unique(ndarray, return_inverse=True)
-        ndarray = np.array([self.curve.get(x) for x in u])[inv].reshape(ndarray.shape)
 
-        image_array.R = ndarray[..., 0]
-        image_array.G = ndarray[..., 1]
-        image_array.B = ndarray[..., 2]
+class AutoContrast(HistogramFilter):
+    """Stretch all channels alike so the darkest and brightest values, leaving
+    out `clip` percent of each, become 0 and 255. Hues are kept."""
 
+    def __init__(
+        self, clip: float = 0.5, samples: Optional[int] = HISTOGRAM_SAMPLES
+    ) -> None:
+        super().__init__(samples)
+        self.clip = min(max(clip, 0), 50)
 
-class Exposure(Filter):
-    def __init__(self, adjust: int = 1) -> None:
-        self.adjust = abs(adjust) / 100
-        self.p1 = (0, self.adjust * 255)
-        self.p2 = (255 - (self.adjust * 255), 255)
+    def table(self, histograms: np.ndarray) -> np.ndarray:
+        low, high = _percentiles(histograms.sum(axis=0), self.clip)
+        return np.tile(_stretch_table(low, high), (3, 1))
 
-    def process(self, image_array: ImageArray) -> None:
-        Curves((0, 0), self.p1, self.p2, (255, 255)).process(image_array)
 
+class AutoLevels(AutoContrast):
+    """Stretch each channel on its own, like AutoContrast, which also removes
+    color casts that only affect the shadows or highlights."""
+
+    def table(self, histograms: np.ndarray) -> np.ndarray:
+        return np.array(
+            [
+                _stretch_table(*_percentiles(histogram, self.clip))
+                for histogram in histograms
+            ]
+        )
+
+
+class AutoWhiteBalance(HistogramFilter):
+    """Scale each channel so the image averages to gray, by `adjust` percent."""
+
+    def __init__(
+        self, adjust: int = 100, samples: Optional[int] = HISTOGRAM_SAMPLES
+    ) -> None:
+        super().__init__(samples)
+        self.adjust = adjust / 100
+
+    def table(self, histograms: np.ndarray) -> np.ndarray:
+        counts = histograms.sum(axis=1)
+        if not counts.all():
+            return IDENTITY
+        means = histograms @ np.arange(256) / counts
+        if not means.all():
+            return IDENTITY
+        scales = 1 + (means.mean() / means - 1) * self.adjust
+        values = np.arange(256) * scales[:, None]
+        return np.clip(np.rint(values), 0, 255).astype(np.uint8)
 
-class Posterize(Filter):
-    def __init__(self, adjust) -> None:
-        self.num_areas = 256 / adjust
-        self.num_values = 255 / (adjust - 1)
+
+# OpenCV's default border, mirroring the pixels next to the edge
+BORDER_REFLECT_101 = 4
+
+
+class SpatialFilter(Filter):
+    """Filter computing each pixel from its neighbours up to `halo` pixels away.
+
+    Subclasses implement `filter_frame` with OpenCV on uint8 RGB frames, so
+    pixels stay uint8 from end to end, rounded and saturated by OpenCV, and
+    need no further constraining. Every spatial filter reflects the image at
+    its borders with BORDER_REFLECT_101, while bands and tiles get the rows
+    they need from their neighbours through the halo, so results do not
+    depend on how the image is split.
+    """
 
     def process(self, image_array: ImageArray) -> None:
-        ndarray = image_array.get_current()
-        ndarray = np.floor(ndarray / self.num_areas) * self.num_values
+        frame = image_array.get_current_rgb(image_array.scratch_frame(rgb=True))
+        out = image_array.scratch("spatial", frame.shape, np.uint8)
+        if image_array.is_stack:
+            # OpenCV filters a single image at a time
+            for image, image_out in zip(frame, out):
+                self.filter_frame(image, image_out)
+        else:
+            self.filter_frame(frame, out)
+        image_array.R, image_array.G, image_array.B = (
+            out[..., index] for index in range(3)
+        )
+
+    @abc.abstractmethod
+    def filter_frame(self, frame: np.ndarray, out: np.ndarray) -> None:
+        """Write the filtered (height, width, 3) uint8 frame into `out`."""
+
+
+def _check_radius(radius: int) -> int:
+    if radius < 0 or int(radius) != radius:
+        raise FilterException(f"Radius must be a positive integer, not `{radius}`.")
+    return int(radius)
 
-        image_array.R = ndarray[..., 0]
-        image_array.G = ndarray[..., 1]
-        image_array.B = ndarray[..., 2]
-        image_array.constrain_channels()
 
+def _gaussian_kernel(radius: int, sigma: Optional[float] = None) -> np.ndarray:
+    """Normalized 1D Gaussian of 2 * radius + 1 taps.
+
+    Without `sigma`, OpenCV's default for the kernel size is used.
+    """
+    import cv2
+
+    kernel = cv2.getGaussianKernel(2 * radius + 1, sigma or 0, ktype=cv2.CV_32F)
+    return kernel.ravel()
+
+
+class SeparableFilter(SpatialFilter):
+    """Spatial filter whose 2D kernel is the product of a column and a row one,
+    applied in two 1D passes."""
+
+    @abc.abstractmethod
+    def kernels(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the float32 (horizontal, vertical) kernels."""
+
+    def filter_frame(self, frame: np.ndarray, out: np.ndarray) -> None:
+        import cv2
+
+        kernel_x, kernel_y = self.kernels()
+        cv2.sepFilter2D(
+            frame, -1, kernel_x, kernel_y, dst=out, borderType=BORDER_REFLECT_101
+        )
+
+
+class BoxBlur(SeparableFilter):
+    def __init__(self, radius: int = 1) -> None:
+        self.radius = _check_radius(radius)
+        self.halo = self.radius
+
+    def kernels(self) -> Tuple[np.ndarray, np.ndarray]:
+        size = 2 * self.radius + 1
+        kernel = np.full(size, 1 / size, dtype=np.float32)
+        return kernel, kernel
+
+
+class GaussianBlur(SeparableFilter):
+    def __init__(self, radius: int = 2, sigma: Optional[float] = None) -> None:
+        self.radius = _check_radius(radius)
+        self.sigma = sigma
+        self.halo = self.radius
+
+    def kernels(self) -> Tuple[np.ndarray, np.ndarray]:
+        kernel = _gaussian_kernel(self.radius, self.sigma)
+        return kernel, kernel
+
+
+class UnsharpMask(SpatialFilter):
+    """Add `amount` percent of the difference between the image and its
+    Gaussian blur, where that difference is at least `threshold`."""
+
+    def __init__(self, amount: int = 100, radius: int = 2, threshold: int = 0):
+        self.amount = amount / 100
+        self.radius = _check_radius(radius)
+        self.threshold = threshold
+        self.halo = self.radius
+
+    def filter_frame(self, frame: np.ndarray, out: np.ndarray) -> None:
+        import cv2
+
+        kernel = _gaussian_kernel(self.radius)
+        blurred = cv2.sepFilter2D(
+            frame, -1, kernel, kernel, borderType=BORDER_REFLECT_101
+        )
+        cv2.addWeighted(frame, 1 + self.amount, blurred, -self.amount, 0, dst=out)
+        if self.threshold > 0:
+            unchanged = cv2.absdiff(frame, blurred) < self.threshold
+            np.copyto(out, frame, where=unchanged)
+
+
+class Edges(SpatialFilter):
+    """Sum of the absolute horizontal and vertical Sobel gradients of each
+    channel, scaled by `adjust` percent."""
+
+    halo = 1
+
+    def __init__(self, adjust: int = 100) -> None:
+        self.adjust = adjust / 100
+
+    def filter_frame(self, frame: np.ndarray, out: np.ndarray) -> None:
+        import cv2
+
+        gradients = [
+            cv2.convertScaleAbs(
+                cv2.Sobel(
+                    frame,
+                    cv2.CV_16S,
+                    dx,
+                    1 - dx,
+                    ksize=3,
+                    borderType=BORDER_REFLECT_101,
+                ),
+                alpha=self.adjust,
+            )
+            for dx in (1, 0)
+        ]
+        cv2.add(*gradients, dst=out)
+
+
+class Sharpen(SpatialFilter):
+    halo = 1
 
-class Sharpen(Filter):
     def __init__(self, adjust=100) -> None:
         self.adjust = adjust / 100
 
-    def process(self, image_array: ImageArray) -> None:
-        ndarray = image_array.get_current()
+    def filter_frame(self, frame: np.ndarray, out: np.ndarray) -> None:
+        import cv2
+
         sharpen_kernel = np.array(
             [
                 [0, -self.adjust, 0],
@@ -394,8 +1006,45 @@ class Sharpen(Filter):
                 [0, -self.adjust, 0],
             ]
         )
-        ndarray = cv2.filter2D(ndarray, -1, sharpen_kernel)
-        image_array.R = ndarray[..., 0]
-        image_array.G = ndarray[..., 1]
-        image_array.B = ndarray[..., 2]
-        image_array.constrain_channels()
+        cv2.filter2D(frame, -1, sharpen_kernel, dst=out, borderType=BORDER_REFLECT_101)
+
+
+class Vignette(Filter):
+    """Darken the image towards its corners by up to `adjust` percent.
+
+    Pixels closer to the center than `size` percent of the distance to the
+    corners are left unchanged. The darkening depends on where pixels are in
+    the whole image, so bands and tiles give the same result.
+    """
+
+    def __init__(self, adjust: int = 50, size: int = 50) -> None:
+        self.adjust = adjust / 100
+        self.size = min(max(size / 100, 0), 1)
+
+    def factors(self, image_array: ImageArray) -> np.ndarray:
+        """Return the (rows, columns) multipliers for the image array's rows."""
+        shape = image_array.original_array.shape
+        rows, columns = shape[-3:-1]
+        offset = 0 if image_array.is_stack else image_array.row_offset
+        y = np.arange(offset, offset + rows, dtype=np.float32) + 0.5
+        y = y / image_array.rows * 2 - 1
+        x = (np.arange(columns, dtype=np.float32) + 0.5) / columns * 2 - 1
+        # 0 at the center, 1 in the corners
+        distance = np.sqrt((y[:, None] ** 2 + x**2) / 2)
+
+        if self.size >= 1:
+            return np.ones_like(distance)
+        falloff = np.clip((distance - self.size) / (1 - self.size), 0, 1)
+        return np.maximum(1 - self.adjust * falloff**2, 0)
+
+    def process(self, image_array: ImageArray) -> None:
+        frame = image_array.get_current_rgb(image_array.scratch_frame(rgb=True))
+        result = image_array.scratch("vignette", frame.shape, np.float32)
+        np.multiply(frame, self.factors(image_array)[..., None], out=result)
+
+        out = image_array.scratch("spatial", frame.shape, np.uint8)
+        # Casting to uint8 truncates like constrain_channels
+        np.clip(result, 0, 255, out=out, casting="unsafe")
+        image_array.R, image_array.G, image_array.B = (
+            out[..., index] for index in range(3)
+        )
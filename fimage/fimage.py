@@ -1,30 +1,404 @@
+import functools
+import io
+from typing import Optional
+
 import numpy as np
-from PIL import Image, ImageOps
 
+from fimage.cache import content_hash, signature
+from fimage.checkpoints import Checkpoints
 from fimage.class_register import ClassMapRegister
+from fimage.exceptions import FimageException
 from fimage.image_array import ImageArray
+from fimage.pipeline import compile_pipeline
+
+PREVIEW_SCALES = (1, 2, 4, 8)
+
+EXIF_ORIENTATION = 0x0112
 
 
 class FImage:
-    def __init__(self, image) -> None:
-        self.original_image = Image.open(image)
-        # Correct image orientation based on exif information
-        self.image = ImageOps.exif_transpose(self.original_image)
+    """Image loaded with Pillow, which is only imported once one is created.
+
+    `image` is a path or file object, the encoded file as bytes, or a
+    (height, width, 3 or 4) uint8 array of RGB(A) pixels used without being
+    decoded or copied. Decoded pixels are exported from Pillow once and then
+    only viewed, and the Pillow `image` is only built from the filtered pixels
+    when it is read, e.g. by `save` or `to_bytes`.
+
+    With `preview` set to 2, 4 or 8 the image is decoded at that fraction of
+    its size, using JPEG draft decoding when possible, and filters run on the
+    small array. `save` then renders the full resolution image from the source
+    with every filter applied so far.
+
+    With a `cache` from `fimage.cache`, `apply` looks up the pixels resulting
+    from the decoded source and the whole chain of filters applied so far, and
+    only runs the filters on a miss.
+
+    With `checkpoint_bytes` set, the frame produced by every `apply` call is
+    kept as a checkpoint, spilled to memory-mapped files past that many bytes.
+    `replace` then only reruns the filters from the edited one on, while
+    `undo` and `redo` restore checkpoints without running any filter. Without
+    checkpoints, which is the default, they decode the source again and rerun
+    every step they keep.
+
+    `dtype` and `fixed_point` select how ImageArray stores and computes the
+    channels; see ImageArray.
+
+    From asyncio code, `await FImage.aopen(...)`, `aapply` and `asave` do the
+    same work in an executor, see `fimage.aio`.
+    """
+
+    def __init__(
+        self,
+        image,
+        dtype=None,
+        workers: int = 1,
+        preview: Optional[int] = None,
+        cache=None,
+        checkpoint_bytes: Optional[int] = None,
+        fixed_point: Optional[bool] = None,
+    ) -> None:
+        if preview not in (None,) + PREVIEW_SCALES:
+            raise FimageException(
+                f"Preview scale must be one of {PREVIEW_SCALES}, not `{preview}`."
+            )
+
+        self.source = image
+        self.dtype = dtype
+        self.fixed_point = fixed_point
+        self.workers = workers
+        self.preview = preview if preview != 1 else None
+        self.cache = cache
+        self.filters = []
+        # Number of filters applied after each `apply` call
+        self.steps = []
+        self.checkpoints = None
+        if checkpoint_bytes is not None:
+            self.checkpoints = Checkpoints(checkpoint_bytes)
+        # Filters removed by `undo`, the most recently undone last
+        self._undone = []
+        # Used by the async methods, see `aopen`
+        self.executor = None
+        self.limiter = None
+
+        if isinstance(image, np.ndarray):
+            self._open_array(image)
+        else:
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                image = io.BytesIO(image)
+            self._open(image)
+
+        # Hashed before any filter can touch the decoded pixels
+        self.source_hash = content_hash(self._frame) if cache else None
+
+    @classmethod
+    async def aopen(cls, image, executor=None, limiter=None, **kwargs) -> "FImage":
+        """Create an FImage without blocking the event loop.
+
+        Files are read in the executor, then decoded there once the limiter
+        has room for the image's megapixels. `executor` and `limiter` default
+        to those of `fimage.aio` and are kept for `aapply` and `asave`. Other
+        arguments are those of FImage.
+        """
+        from fimage import aio
+
+        if aio.is_file(image):
+            image = await aio.run(
+                functools.partial(aio.read_bytes, image), executor=executor
+            )
+        if isinstance(image, np.ndarray):
+            megapixels = image.shape[0] * image.shape[1] / 1e6
+        else:
+            megapixels = aio.encoded_megapixels(image, kwargs.get("preview"))
+
+        opened = await aio.run(
+            functools.partial(cls, image, **kwargs), megapixels, executor, limiter
+        )
+        opened.executor = executor
+        opened.limiter = limiter
+        return opened
+
+    async def aapply(self, *filters, **kwargs_filters) -> None:
+        """Run `apply` in the executor, see `aopen`."""
+        from fimage import aio
+
+        await aio.run(
+            functools.partial(self.apply, *filters, **kwargs_filters),
+            self.megapixels,
+            self.executor,
+            self.limiter,
+        )
+
+    async def asave(self, file, format: Optional[str] = None, **kwargs) -> None:
+        """Encode the image in the executor and write it to a path or file
+        object, see `aopen`. The format defaults as for `save`."""
+        from fimage import aio
+
+        format = format or aio.format_for(file)
+        data = await aio.run(
+            functools.partial(self.to_bytes, format, **kwargs),
+            self.megapixels * (self.preview or 1) ** 2,
+            self.executor,
+            self.limiter,
+        )
+        await aio.run(
+            functools.partial(aio.write_bytes, file, data), executor=self.executor
+        )
+
+    @property
+    def megapixels(self) -> float:
+        return self._frame.shape[0] * self._frame.shape[1] / 1e6
+
+    def _open(self, file) -> None:
+        from PIL import Image, ImageOps
+
+        self.original_image = Image.open(file)
+        self.format = self.original_image.format
+        full_size = self.original_image.size
+        if self.preview and self.format == "JPEG":
+            # Let the decoder scale by 1/2, 1/4 or 1/8 while decoding
+            width, height = full_size
+            self.original_image.draft(
+                self.original_image.mode,
+                (width // self.preview, height // self.preview),
+            )
+        # Correct image orientation based on exif information. exif_transpose
+        # copies the image even when it has nothing to do.
+        self.image = self.original_image
+        if self.original_image.getexif().get(EXIF_ORIENTATION, 1) != 1:
+            self.image = ImageOps.exif_transpose(self.original_image)
         self.exif_data = self.image.getexif()
-        self.image_array = ImageArray(np.array(self.image))
+        self.mode = self.image.mode
+        if self.preview:
+            # Reduce what the decoder did not scale down already
+            decoded_scale = round(max(full_size) / max(self.image.size))
+            factor = self.preview // decoded_scale
+            if factor > 1:
+                self.image = self.image.reduce(factor)
+        # Filters never write to the read-only array, which wraps the pixels
+        # Pillow exports without another copy
+        self._frame = np.asarray(self.image)
+        self.image_array = self._image_array(self._frame)
+        # Pillow's own copy of the pixels is rebuilt only if `image` is read
+        self.image = None
+        self.original_image.close()
+
+    def _open_array(self, ndarray: np.ndarray) -> None:
+        from PIL import Image
+
+        if (
+            ndarray.dtype != np.uint8
+            or ndarray.ndim != 3
+            or ndarray.shape[-1] not in (3, 4)
+        ):
+            raise FimageException(
+                "Arrays must be (height, width, 3 or 4) uint8 RGB(A) pixels, "
+                f"not {ndarray.dtype} with shape {ndarray.shape}."
+            )
+
+        self.original_image = None
+        self.format = None
+        self.exif_data = Image.Exif()
+        self.mode = "RGBA" if ndarray.shape[-1] == 4 else "RGB"
+        if self.preview:
+            ndarray = np.asarray(Image.fromarray(ndarray).reduce(self.preview))
+        self.image = None
+        self._frame = ndarray
+        self.image_array = self._image_array(ndarray)
+
+    @property
+    def image(self):
+        """Pillow image of the current pixels, built the first time it is read."""
+        if self._image is None:
+            self._image = self.ndarray_to_image(self._frame)
+        return self._image
+
+    @image.setter
+    def image(self, image) -> None:
+        self._image = image
 
     def apply(self, *filters, **kwargs_filters):
         filters = list(filters)
         for filter, value in kwargs_filters.items():
             filters.append(ClassMapRegister.get_class(filter, value))
 
-        for t in filters:
-            t.process(self.image_array)
+        self._undone.clear()
+        if self.checkpoints is not None:
+            if not self.filters and 0 not in self.checkpoints:
+                # No filter has run, the source frame is the current one
+                self.checkpoints.put(0, self._frame)
+            self.checkpoints.discard_after(len(self.filters))
+        self._run(filters)
+
+    def _run(self, filters) -> None:
+        """Apply filters as one step and keep the resulting checkpoint, if any."""
+        key = self.cache_key(self.filters + filters)
+        cached = self.cache.get(key) if key else None
+        if cached is not None:
+            self.image_array = self._image_array(cached)
+        else:
+            pipeline = compile_pipeline(filters)
+            pipeline.process(self.image_array, workers=self.workers)
+        self.filters.extend(filters)
+        self.steps.append(len(self.filters))
+
+        frame = self.image_array.get_current()
+        self._set_frame(frame)
+        if self.checkpoints is not None:
+            self.checkpoints.put(len(self.filters), frame)
+        if key and cached is None:
+            self.cache.put(key, frame)
+
+    def _restore(self, count: int) -> None:
+        """Go back to the frame produced by the first `count` filters.
+
+        `filters` and `steps` must already end there.
+        """
+        if self.checkpoints is not None:
+            frame = self.checkpoints.get(count)
+            self.image_array = self._image_array(frame)
+            self._set_frame(frame)
+            return
+
+        # Render the steps that are kept again from the source
+        frame = self._decode_source()
+        self.image_array = self._image_array(frame)
+        self._set_frame(frame)
+        filters, steps = self.filters, self.steps
+        self.filters, self.steps = [], []
+        for step in steps:
+            self._run(filters[len(self.filters) : step])
+
+    def _decode_source(self) -> np.ndarray:
+        if hasattr(self.source, "seek"):
+            self.source.seek(0)
+        image = FImage(
+            self.source,
+            dtype=self.dtype,
+            preview=self.preview,
+            fixed_point=self.fixed_point,
+        )
+        return image._frame
+
+    def replace(self, index: int, filter) -> None:
+        """Replace the filter at `index` in `filters` and re-render.
+
+        Only the steps from the one containing that filter on are run again.
+        """
+        filters = list(self.filters)
+        filters[index] = filter
+        index = range(len(filters))[index]
+
+        start = 0
+        if self.checkpoints is not None:
+            start = self.checkpoints.latest(index)
+        steps = [step for step in self.steps if step > start]
+        self.steps = [step for step in self.steps if step <= start]
+        self.filters = filters[:start]
+        self._undone.clear()
+        if self.checkpoints is not None:
+            self.checkpoints.discard_after(start)
+        self._restore(start)
+
+        for step in steps:
+            self._run(filters[len(self.filters) : step])
+
+    def undo(self) -> None:
+        """Remove the filters of the last `apply` call."""
+        if not self.steps:
+            raise FimageException("There is nothing to undo.")
+
+        self.steps.pop()
+        count = self.steps[-1] if self.steps else 0
+        self._undone.append(self.filters[count:])
+        del self.filters[count:]
+        self._restore(count)
+
+    def redo(self) -> None:
+        """Apply again the filters removed by the last `undo`."""
+        if not self._undone:
+            raise FimageException("There is nothing to redo.")
 
-        self.image = self.ndarray_to_image()
+        filters = self._undone.pop()
+        count = len(self.filters) + len(filters)
+        if self.checkpoints is None or count not in self.checkpoints:
+            self._run(filters)
+            return
 
-    def ndarray_to_image(self):
-        return Image.fromarray(self.image_array.get_current(), self.image.mode)
+        self.filters.extend(filters)
+        self.steps.append(count)
+        self._restore(count)
+
+    def _set_frame(self, frame: np.ndarray) -> None:
+        # The Pillow image is built from the frame when it is next read
+        self._frame = frame
+        self.image = None
+
+    def _image_array(self, ndarray: np.ndarray) -> ImageArray:
+        return ImageArray(ndarray, dtype=self.dtype, fixed_point=self.fixed_point)
+
+    def cache_key(self, filters) -> Optional[str]:
+        """Return the cache key for the decoded source and a filter chain."""
+        if self.cache is None:
+            return None
+
+        chain_signature = signature(filters)
+        if chain_signature is None:
+            return None
+
+        # Storage and arithmetic modes can change the last bit of results
+        image_array = self.image_array
+        mode = np.dtype(image_array.dtype).name if image_array.dtype else ""
+        if image_array.fixed_point:
+            mode += "fixed"
+        if mode:
+            chain_signature = f"{chain_signature}-{mode}"
+        return self.cache.key(self.source_hash, chain_signature)
+
+    def ndarray_to_image(self, ndarray: Optional[np.ndarray] = None):
+        """Wrap pixels in a Pillow image, sharing their memory when the layout
+        allows it, as for RGBA."""
+        from PIL import Image
+
+        if ndarray is None:
+            ndarray = self.image_array.get_current()
+        return Image.fromarray(ndarray, self.mode)
+
+    def to_ndarray(self) -> np.ndarray:
+        """Return the current pixels as a (height, width, channels) uint8 array.
+
+        The array may be shared with the image's own state, don't modify it.
+        """
+        return self._frame
+
+    def render(self) -> "FImage":
+        """Return the full resolution image with every applied filter."""
+        if not self.preview:
+            return self
+
+        if hasattr(self.source, "seek"):
+            self.source.seek(0)
+
+        image = FImage(
+            self.source,
+            dtype=self.dtype,
+            workers=self.workers,
+            cache=self.cache,
+            fixed_point=self.fixed_point,
+        )
+        image.apply(*self.filters)
+        return image
 
     def save(self, *args, **kwargs):
-        self.image.save(exif=self.exif_data, *args, **kwargs)
+        image = self.render()
+        image.image.save(exif=image.exif_data, *args, **kwargs)
+
+    def to_bytes(self, format: Optional[str] = None, **kwargs) -> bytes:
+        """Encode the image in memory, in the source's format by default.
+
+        Images built from arrays default to PNG. Other keyword arguments are
+        passed to Pillow as for `save`.
+        """
+        buffer = io.BytesIO()
+        self.save(buffer, format=format or self.format or "PNG", **kwargs)
+        return buffer.getvalue()
@@ -1,9 +1,72 @@
+from typing import Optional, Tuple
+
 import numpy as np
 
+from fimage.lut import is_lut_index
+
+# Default for the `fixed_point` argument of ImageArray. Set it to True to run
+# weighted sums in integer arithmetic everywhere, see ImageArray.
+FIXED_POINT = False
+
+# Pixels sampled by default for `ImageArray.histograms`
+HISTOGRAM_SAMPLES = 1 << 20
+
 
 class ImageArray:
-    def __init__(self, ndarray: np.ndarray) -> None:
+    """Working RGB(A) state shared by the filters.
+
+    By default every filter step replaces R, G and B with new arrays. When a
+    `dtype` (np.int16 or np.float32) is given, the channels live in a single
+    contiguous (3, ...) buffer instead, and assigning a channel writes into it.
+    Intermediate values are then stored in that dtype, e.g. int16 truncates
+    them the same way `constrain_channels` does.
+
+    With `fixed_point`, filters doing weighted sums of the channels (color
+    matrices such as Sepia and Grayscale, and Saturation) compute them with
+    int32 arithmetic and weights scaled by 2**16 instead of float64, which
+    moves half as many bytes. Each
+    result is then within +/-1 of the float one for the same input. Point
+    filters such as Contrast or Colorize need no such mode, as they already
+    go through integer lookup tables. `None` uses the module's FIXED_POINT.
+
+    `ndarray` is a single (height, width, channels) frame, or a stack of
+    same-sized frames with shape (count, height, width, channels) that every
+    filter processes in one pass, with the same results as frame by frame.
+    """
+
+    def __init__(
+        self, ndarray: np.ndarray, dtype=None, fixed_point: Optional[bool] = None
+    ) -> None:
+        self.dtype = dtype
+        self.fixed_point = FIXED_POINT if fixed_point is None else fixed_point
+        # Where these rows are in the whole image, when they are only a band
+        # or a tile of it, for filters that depend on the pixel positions.
+        # For a stack, the offset is that of the first frame.
+        self.row_offset = 0
+        self.full_rows = None
+        self.buffer = None
+        self._scratch = {}
+        # Histograms of the current pixels by sampling step
+        self._histograms = {}
+        self.reset(ndarray)
+
+    def reset(self, ndarray: np.ndarray) -> None:
+        """Start over from a new frame.
+
+        In buffered mode the buffer and scratch arrays are kept as long as the
+        frame size does not change, so processing a sequence of frames does
+        not allocate them again.
+        """
         self.original_array = ndarray
+        self._channels = [None, None, None]
+
+        if self.dtype is not None:
+            shape = (3,) + ndarray.shape[:-1]
+            if self.buffer is None or self.buffer.shape != shape:
+                self.buffer = np.empty(shape, dtype=self.dtype)
+                self._scratch = {}
+            self._channels = list(self.buffer)
+
         self.R = self.original_array[..., 0]
         self.G = self.original_array[..., 1]
         self.B = self.original_array[..., 2]
@@ -12,30 +75,161 @@ class ImageArray:
         if self.original_array.shape[-1] == 4:
             self.A = self.original_array[..., 3]
 
+    @property
+    def R(self):
+        return self._channels[0]
+
+    @R.setter
+    def R(self, value) -> None:
+        self._set_channel(0, value)
+
+    @property
+    def G(self):
+        return self._channels[1]
+
+    @G.setter
+    def G(self, value) -> None:
+        self._set_channel(1, value)
+
+    @property
+    def B(self):
+        return self._channels[2]
+
+    @B.setter
+    def B(self, value) -> None:
+        self._set_channel(2, value)
+
+    def _set_channel(self, index: int, value) -> None:
+        self._histograms.clear()
+        if self.buffer is None:
+            self._channels[index] = value
+            return
+
+        channel = self._channels[index]
+        if not self._is_view_of(value, channel):
+            channel[...] = value
+
+    def _is_view_of(self, value, channel: np.ndarray) -> bool:
+        # Filters may hand back the buffer they were given through `out`
+        return value is channel or (
+            isinstance(value, np.ndarray)
+            and value.base is self.buffer
+            and value.__array_interface__ == channel.__array_interface__
+        )
+
+    @property
+    def is_stack(self) -> bool:
+        return self.original_array.ndim == 4
+
     @property
     def has_alpha(self):
         return True if self.A is not None else False
 
+    @property
+    def rows(self) -> int:
+        """Number of rows in the whole image, or in each frame of a stack."""
+        if self.is_stack:
+            return self.original_array.shape[1]
+        return self.full_rows or self.original_array.shape[0]
+
+    def band(self, start: int, stop: int) -> "ImageArray":
+        """Return a new ImageArray viewing rows start:stop of this one.
+
+        For a stack, start:stop selects frames instead.
+        """
+        # Bands keep the storage and arithmetic modes, so their results match
+        # the whole image's
+        band = ImageArray(
+            self.original_array[start:stop],
+            dtype=self.dtype,
+            fixed_point=self.fixed_point,
+        )
+        band.row_offset = self.row_offset + start
+        if not self.is_stack:
+            band.full_rows = self.rows
+        band.R, band.G, band.B = (
+            channel[start:stop] if np.ndim(channel) else channel
+            for channel in (self.R, self.G, self.B)
+        )
+        return band
+
+    def histograms(self, samples: Optional[int] = HISTOGRAM_SAMPLES) -> np.ndarray:
+        """Return the (3, 256) counts of each R, G and B value.
+
+        Images over `samples` pixels are sampled every few rows and columns,
+        None counts every pixel. Histograms are kept until a channel is next
+        assigned, so filters reading them one after another share one scan.
+        """
+        shape = self.original_array.shape[:-1]
+        step = 1
+        if samples:
+            step = max(1, int(np.sqrt(np.prod(shape) / samples)))
+
+        histograms = self._histograms.get(step)
+        if histograms is None:
+            # Every frame of a stack is sampled the same way
+            sample = (slice(None),) * (len(shape) - 2) + (slice(None, None, step),) * 2
+            histograms = np.empty((3, 256), dtype=np.int64)
+            for index, channel in enumerate((self.R, self.G, self.B)):
+                values = np.broadcast_to(channel, shape)[sample]
+                if not is_lut_index(values):
+                    # Count values as get_current would store them
+                    values = values.astype(np.uint8)
+                histograms[index] = np.bincount(values.ravel(), minlength=256)
+            self._histograms[step] = histograms
+        return histograms
+
+    def scratch(self, name: str, shape: Tuple, dtype) -> np.ndarray:
+        """Return a work array whose content is undefined.
+
+        In buffered mode the array is kept and handed out again on the next
+        call with the same name, shape and dtype, so callers must be done with
+        it before asking for it again.
+        """
+        if self.buffer is None:
+            return np.empty(shape, dtype=dtype)
+
+        array = self._scratch.get(name)
+        if array is None or array.shape != tuple(shape) or array.dtype != dtype:
+            array = np.empty(shape, dtype=dtype)
+            self._scratch[name] = array
+        return array
+
+    def scratch_frame(self, rgb: bool = False) -> np.ndarray:
+        """Return a scratch uint8 frame to pass as `out` to get_current(_rgb)."""
+        shape = self.original_array.shape
+        if rgb:
+            shape = shape[:-1] + (3,)
+        return self.scratch("rgb_frame" if rgb else "frame", shape, np.uint8)
+
     def constrain_channels(self) -> None:
+        if self.buffer is not None:
+            if self.buffer.dtype.kind == "f":
+                np.trunc(self.buffer, out=self.buffer)
+            np.clip(self.buffer, 0, 255, out=self.buffer)
+            return
+
         new_array = np.array([self.R, self.G, self.B], dtype=np.int16)
         np.clip(new_array, 0, 255, out=new_array)
         self.R, self.G, self.B = new_array
 
-    def get_current(self) -> np.ndarray:
+    def get_current(self, out: Optional[np.ndarray] = None) -> np.ndarray:
         """Return an array with the original shape and updated RGB(A) values."""
-        new_array = np.empty(self.original_array.shape, dtype=np.uint8)
-        new_array[..., 0] = self.R
-        new_array[..., 1] = self.G
-        new_array[..., 2] = self.B
+        if out is None:
+            out = np.empty(self.original_array.shape, dtype=np.uint8)
+        out[..., 0] = self.R
+        out[..., 1] = self.G
+        out[..., 2] = self.B
         if self.has_alpha:
-            new_array[..., 3] = self.A
-        return new_array
+            out[..., 3] = self.A
+        return out
 
-    def get_current_rgb(self) -> np.ndarray:
+    def get_current_rgb(self, out: Optional[np.ndarray] = None) -> np.ndarray:
         """Return an array with only RGB values."""
-        rgb_shape = self.original_array.shape[:-1] + (3,)
-        new_array = np.empty(rgb_shape, dtype=np.uint8)
-        new_array[..., 0] = self.R
-        new_array[..., 1] = self.G
-        new_array[..., 2] = self.B
-        return new_array
+        if out is None:
+            rgb_shape = self.original_array.shape[:-1] + (3,)
+            out = np.empty(rgb_shape, dtype=np.uint8)
+        out[..., 0] = self.R
+        out[..., 1] = self.G
+        out[..., 2] = self.B
+        return out
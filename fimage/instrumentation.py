@@ -0,0 +1,222 @@
+"""Opt-in measurements of every filter, preset and fused stage invocation.
+
+Nothing is measured until a sink is registered, either for good with
+`add_sink` or for the duration of a `with instrument(...)` block. A sink is
+any callable taking a `Record`; `LoggingSink` and `MetricsRegistry` are
+provided. While no sink is registered the only cost is one list check per
+filter call.
+"""
+
+import contextlib
+import functools
+import logging
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# Sinks receiving a Record for every instrumented call
+_sinks: List[Callable] = []
+_local = threading.local()
+
+
+class Record(NamedTuple):
+    name: str
+    # Nesting level, e.g. 1 for a filter run by a preset
+    depth: int
+    wall_seconds: float
+    cpu_seconds: float
+    # Bytes still allocated after the call, and the peak during it, when
+    # memory is traced
+    allocated_bytes: Optional[int]
+    peak_bytes: Optional[int]
+    shape: Tuple[int, ...]
+    dtypes_in: Tuple[str, ...]
+    dtypes_out: Tuple[str, ...]
+
+
+def add_sink(sink: Callable) -> None:
+    _sinks.append(sink)
+
+
+def remove_sink(sink: Callable) -> None:
+    _sinks.remove(sink)
+
+
+def _name(obj) -> str:
+    if isinstance(obj, type):
+        return obj.__name__
+    if type(obj).__repr__ is not object.__repr__:
+        # e.g. FusedStage([Contrast, Sepia])
+        return repr(obj)
+    return type(obj).__name__
+
+
+def _dtypes(image_array) -> Tuple[str, ...]:
+    return tuple(
+        np.asarray(channel).dtype.name
+        for channel in (image_array.R, image_array.G, image_array.B)
+    )
+
+
+def instrumented(process: Callable) -> Callable:
+    """Wrap a `process(obj, image_array)` method so its calls are measured."""
+
+    @functools.wraps(process)
+    def wrapper(obj, image_array, *args, **kwargs):
+        if not _sinks:
+            return process(obj, image_array, *args, **kwargs)
+        return _measure(process, obj, image_array, args, kwargs)
+
+    return wrapper
+
+
+def _measure(process, obj, image_array, args, kwargs):
+    # Peaks of the calls running in this thread, the outermost first
+    peaks = _local.__dict__.setdefault("peaks", [])
+    tracing = tracemalloc.is_tracing()
+    reset_peak = getattr(tracemalloc, "reset_peak", None)
+
+    dtypes_in = _dtypes(image_array)
+    if tracing:
+        current = tracemalloc.get_traced_memory()[0]
+        if reset_peak and peaks:
+            # Keep what the caller reached so far before measuring this call
+            peaks[-1] = max(peaks[-1], tracemalloc.get_traced_memory()[1])
+        if reset_peak:
+            reset_peak()
+    peaks.append(0)
+
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    try:
+        result = process(obj, image_array, *args, **kwargs)
+    finally:
+        wall = time.perf_counter() - wall
+        cpu = time.thread_time() - cpu
+        peak = peaks.pop()
+        if tracing:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        if peaks:
+            peaks[-1] = max(peaks[-1], peak)
+
+    allocated = None
+    if tracing:
+        allocated = tracemalloc.get_traced_memory()[0] - current
+        peak -= current
+
+    record = Record(
+        name=_name(obj),
+        depth=len(peaks),
+        wall_seconds=wall,
+        cpu_seconds=cpu,
+        allocated_bytes=allocated,
+        peak_bytes=peak if tracing and reset_peak else None,
+        shape=tuple(image_array.original_array.shape),
+        dtypes_in=dtypes_in,
+        dtypes_out=_dtypes(image_array),
+    )
+    for sink in list(_sinks):
+        sink(record)
+    return result
+
+
+@contextlib.contextmanager
+def instrument(*sinks: Callable, memory: bool = True):
+    """Measure every filter call made inside the block.
+
+    Yields the list of records, which also go to `sinks`. With `memory`,
+    tracemalloc is started for the block if it is not running already; it
+    slows down allocations, so leave it off when only timings are needed.
+    Sinks are global while the block runs, so calls made by other threads,
+    like the workers of a banded pipeline, are measured too.
+    """
+    records = []
+    sinks = (records.append,) + sinks
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+
+    _sinks.extend(sinks)
+    try:
+        yield records
+    finally:
+        for sink in sinks:
+            _sinks.remove(sink)
+        if started:
+            tracemalloc.stop()
+
+
+class LoggingSink:
+    """Log one line per record."""
+
+    def __init__(self, logger: Optional[logging.Logger] = None, level=logging.INFO):
+        self.logger = logger or logging.getLogger("fimage")
+        self.level = level
+
+    def __call__(self, record: Record) -> None:
+        memory = ""
+        if record.peak_bytes is not None:
+            memory = f" peak={record.peak_bytes / 2**20:.1f}MiB"
+        self.logger.log(
+            self.level,
+            "%s%s wall=%.1fms cpu=%.1fms%s shape=%s dtypes=%s->%s",
+            "  " * record.depth,
+            record.name,
+            record.wall_seconds * 1000,
+            record.cpu_seconds * 1000,
+            memory,
+            "x".join(map(str, record.shape)),
+            ",".join(record.dtypes_in),
+            ",".join(record.dtypes_out),
+        )
+
+
+class MetricsRegistry:
+    """Prometheus-style metrics per filter name.
+
+    `exposition` renders them in the Prometheus text format, and the values
+    can be read from `samples` to feed any other metrics client.
+    """
+
+    # Name -> (type, description)
+    METRICS = {
+        "fimage_filter_calls_total": ("counter", "Number of filter invocations."),
+        "fimage_filter_wall_seconds_total": ("counter", "Wall time in filters."),
+        "fimage_filter_cpu_seconds_total": ("counter", "CPU time in filters."),
+        "fimage_filter_peak_bytes": ("gauge", "Largest peak allocation seen."),
+    }
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.samples: Dict[str, Dict[str, float]] = {
+            metric: defaultdict(float) for metric in self.METRICS
+        }
+
+    def __call__(self, record: Record) -> None:
+        samples = self.samples
+        with self._lock:
+            samples["fimage_filter_calls_total"][record.name] += 1
+            samples["fimage_filter_wall_seconds_total"][
+                record.name
+            ] += record.wall_seconds
+            samples["fimage_filter_cpu_seconds_total"][
+                record.name
+            ] += record.cpu_seconds
+            if record.peak_bytes is not None:
+                peaks = samples["fimage_filter_peak_bytes"]
+                peaks[record.name] = max(peaks[record.name], record.peak_bytes)
+
+    def exposition(self) -> str:
+        lines = []
+        with self._lock:
+            for metric, (type_, description) in self.METRICS.items():
+                lines.append(f"# HELP {metric} {description}")
+                lines.append(f"# TYPE {metric} {type_}")
+                for name, value in sorted(self.samples[metric].items()):
+                    label = name.replace("\\", "\\\\").replace('"', '\\"')
+                    lines.append(f'{metric}{{filter="{label}"}} {value:g}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,48 @@
+"""Lookup tables for point filters."""
+
+from typing import Iterable, Optional
+
+import numpy as np
+
+IDENTITY = np.tile(np.arange(256, dtype=np.uint8), (3, 1))
+
+
+def compose_luts(luts: Iterable[np.ndarray]) -> np.ndarray:
+    """Compose 3x256 tables into one, applying them in the given order."""
+    result = IDENTITY
+    for lut in luts:
+        result = np.take_along_axis(lut, result.astype(np.intp), axis=1)
+    return result
+
+
+def is_lut_index(channel: np.ndarray) -> bool:
+    """Return whether the channel values can be used to index a table."""
+    channel = np.asarray(channel)
+    if channel.dtype == np.uint8:
+        return True
+
+    if not np.issubdtype(channel.dtype, np.integer) or channel.size == 0:
+        return False
+
+    return bool(channel.min() >= 0 and channel.max() <= 255)
+
+
+def apply_lut(lut: np.ndarray, R, G, B, out: Optional[np.ndarray] = None):
+    """Map R, G and B through a 3x256 table with one gather per channel.
+
+    Returns an int16 (3, ...) stack, or `out` when given, so the result can be
+    used by filters that do arithmetic on the channels without wrapping around.
+    `out` may be the buffer R, G and B are views of.
+    """
+    shape = np.broadcast_shapes(np.shape(R), np.shape(G), np.shape(B))
+    result = out
+    if result is None:
+        result = np.empty((3,) + shape, dtype=np.int16)
+    lut = lut.astype(result.dtype)
+    for index, channel in enumerate((R, G, B)):
+        if np.ndim(channel) and np.shape(channel) == shape:
+            # Indexes are already validated, "clip" avoids a buffered copy
+            np.take(lut[index], channel, out=result[index], mode="clip")
+        else:
+            result[index] = lut[index][channel]
+    return result
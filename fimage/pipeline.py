@@ -0,0 +1,253 @@
+"""Compile filter chains into fused execution plans."""
+
+import itertools
+from typing import Iterable, List
+
+import numpy as np
+
+from fimage.filters import (
+    ColorMatrix,
+    Filter,
+    PointFilter,
+    Saturation,
+    Vibrance,
+    _max_channel,
+    _move_towards_max,
+)
+from fimage.image_array import ImageArray
+from fimage.instrumentation import instrumented
+from fimage.lut import apply_lut, compose_luts, is_lut_index
+from fimage.presets import Preset
+
+# Number of pixels transformed at once by a fused stage, small enough for the
+# intermediate values of every filter in the stage to stay in cache.
+CHUNK_PIXELS = 1 << 16
+
+# Bands thinner than this are not worth their halo and scheduling overhead
+MIN_BAND_ROWS = 16
+
+
+class FusedStage:
+    """Run adjacent point filters in a single pass over the pixels.
+
+    Integer channels go through the composition of the filters' lookup tables,
+    anything else is streamed in row chunks through each filter's transform.
+    """
+
+    halo = 0
+
+    def __init__(self, filters: List[PointFilter]) -> None:
+        self.filters = filters
+        self._lut = None
+
+    def __repr__(self) -> str:
+        names = ", ".join(type(filter_).__name__ for filter_ in self.filters)
+        return f"{type(self).__name__}([{names}])"
+
+    @property
+    def lut(self) -> np.ndarray:
+        if self._lut is None:
+            self._lut = compose_luts(filter_.lut for filter_ in self.filters)
+        return self._lut
+
+    def transform(self, channels: np.ndarray) -> np.ndarray:
+        for filter_ in self.filters:
+            channels = filter_.transform(channels)
+        return channels
+
+    @instrumented
+    def process(self, image_array: ImageArray) -> None:
+        R, G, B = image_array.R, image_array.G, image_array.B
+
+        if all(is_lut_index(channel) for channel in (R, G, B)):
+            image_array.R, image_array.G, image_array.B = apply_lut(
+                self.lut, R, G, B, out=image_array.buffer
+            )
+            return
+
+        if not all(np.ndim(channel) for channel in (R, G, B)):
+            # Channels set to plain values, e.g. by FillColor
+            for filter_ in self.filters:
+                filter_.process(image_array)
+            return
+
+        rows = R.shape[0]
+        step = max(1, CHUNK_PIXELS // max(1, R[0].size))
+        result = np.empty((3,) + R.shape, dtype=np.int16)
+
+        for start in range(0, rows, step):
+            stop = start + step
+            chunk = np.array([R[start:stop], G[start:stop], B[start:stop]])
+            result[:, start:stop] = self.transform(chunk)
+
+        image_array.R, image_array.G, image_array.B = result
+
+
+class VibranceSaturation:
+    """Run a Vibrance followed by a Saturation in a single pass.
+
+    Vibrance never changes the largest channel of a pixel when it `keeps_max`,
+    so Saturation can reuse it and move each channel on from Vibrance's
+    constrained value, without the frame being written and read back in
+    between. Results are identical to running both filters in turn.
+    """
+
+    halo = 0
+
+    def __init__(self, vibrance: Vibrance, saturation: Saturation) -> None:
+        self.filters = [vibrance, saturation]
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}()"
+
+    @instrumented
+    def process(self, image_array: ImageArray) -> None:
+        vibrance, saturation = self.filters
+        if image_array.fixed_point:
+            # Saturation alone would use fixed-point arithmetic
+            for filter_ in self.filters:
+                filter_.process(image_array)
+            return
+
+        ndarray = image_array.get_current_rgb(image_array.scratch_frame(rgb=True))
+        max_array = _max_channel(image_array, ndarray)
+        _move_towards_max(
+            image_array,
+            ndarray,
+            max_array,
+            vibrance.amounts(image_array, ndarray, max_array),
+            saturation.adjust,
+        )
+
+
+class Pipeline:
+    """Ordered list of stages produced by `compile_pipeline`."""
+
+    def __init__(self, stages: List) -> None:
+        self.stages = stages
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.stages!r})"
+
+    def process(self, image_array: ImageArray, workers: int = 1) -> None:
+        """Run every stage over the image.
+
+        With more than one worker, consecutive stages that support it are run
+        on row bands of the image in a thread pool. NumPy and OpenCV release
+        the GIL while they work, and each band carries the halo rows its
+        neighbourhood filters need, so the result is identical to the serial
+        one.
+        """
+        if workers <= 1:
+            for stage in self.stages:
+                stage.process(image_array)
+            return
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for banded, stages in itertools.groupby(
+                self.stages, key=lambda stage: stage.halo is not None
+            ):
+                if banded:
+                    process_bands(list(stages), image_array, executor, workers)
+                else:
+                    for stage in stages:
+                        stage.process(image_array)
+
+
+def process_bands(stages: List, image_array: ImageArray, executor, bands: int) -> None:
+    """Run the stages on `bands` row bands of the image and stitch them.
+
+    A stack of frames is split into bands of frames.
+    """
+    shape = image_array.original_array.shape[:-1]
+    rows = shape[0]
+    halo = sum(stage.halo for stage in stages)
+    if image_array.is_stack:
+        # Bands are whole frames, which filters never mix
+        halo = 0
+    step = max(MIN_BAND_ROWS, -(-rows // bands))
+
+    def process_band(start):
+        stop = min(start + step, rows)
+        top = max(0, start - halo)
+        bottom = min(rows, stop + halo)
+
+        band = image_array.band(top, bottom)
+        for stage in stages:
+            stage.process(band)
+
+        band_shape = (bottom - top,) + shape[1:]
+        return [
+            np.broadcast_to(channel, band_shape)[start - top : stop - top]
+            for channel in (band.R, band.G, band.B)
+        ]
+
+    results = list(executor.map(process_band, range(0, rows, step)))
+    image_array.R, image_array.G, image_array.B = (
+        np.concatenate(parts) for parts in zip(*results)
+    )
+
+
+def flatten_filters(filters: Iterable) -> List[Filter]:
+    """Expand presets, given as classes or instances, into their filters.
+
+    Already compiled pipelines are expanded into their stages.
+    """
+    flat = []
+    for filter_ in filters:
+        if isinstance(filter_, Pipeline):
+            flat.extend(filter_.stages)
+        elif isinstance(filter_, type) and issubclass(filter_, Preset):
+            flat.extend(flatten_filters(filter_.filters))
+        elif isinstance(filter_, Preset):
+            flat.extend(flatten_filters(filter_.filters))
+        else:
+            flat.append(filter_)
+    return flat
+
+
+def compile_pipeline(filters: Iterable) -> Pipeline:
+    """Build an execution plan where adjacent point filters are fused.
+
+    Runs of two or more `PointFilter` instances become a single `FusedStage`,
+    and a `ColorMatrix` filter, like Grayscale or SwapChannels, that
+    `stays_in_range` is folded into the `ColorMatrix` that follows it, see
+    `ColorMatrix.compose`. A Saturation right after a Vibrance is run along
+    with it as a `VibranceSaturation` stage. Every other filter is kept as
+    its own stage.
+    """
+    stages = []
+    run = []
+
+    def close_run():
+        if len(run) > 1:
+            stages.append(FusedStage(list(run)))
+        else:
+            stages.extend(run)
+        run.clear()
+
+    for filter_ in flatten_filters(filters):
+        if isinstance(filter_, PointFilter):
+            run.append(filter_)
+        else:
+            close_run()
+            previous = stages[-1] if stages else None
+            if (
+                isinstance(filter_, ColorMatrix)
+                and isinstance(previous, ColorMatrix)
+                and previous.stays_in_range
+            ):
+                stages[-1] = previous.compose(filter_)
+            elif (
+                isinstance(filter_, Saturation)
+                and isinstance(previous, Vibrance)
+                and previous.keeps_max
+            ):
+                stages[-1] = VibranceSaturation(previous, filter_)
+            else:
+                stages.append(filter_)
+
+    close_run()
+    return Pipeline(stages)
@@ -0,0 +1,168 @@
+"""Apply filters to sequences of frames, such as video, with pipelined threads."""
+
+import queue
+import threading
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from fimage.exceptions import FimageException
+from fimage.image_array import ImageArray
+from fimage.pipeline import compile_pipeline
+
+# Marks the end of the frames going through a queue
+_END = object()
+
+
+class _Failure:
+    def __init__(self, exception: BaseException) -> None:
+        self.exception = exception
+
+
+class FrameStream:
+    """Filter frames given as (height, width, channels) uint8 arrays.
+
+    Filters are compiled, and their lookup tables built, once. Frames are
+    loaded into the same buffered ImageArray, so the working buffer and the
+    scratch arrays are reused from one frame to the next. With `bgr`, frames
+    are in OpenCV's BGR order, and are returned in that order too, without
+    being copied to swap their channels.
+
+    `workers` threads process row bands of each frame, see `Pipeline.process`.
+    """
+
+    def __init__(
+        self,
+        filters,
+        dtype=np.int16,
+        workers: int = 1,
+        bgr: bool = False,
+        queue_size: int = 4,
+    ) -> None:
+        self.pipeline = compile_pipeline(filters)
+        self.dtype = dtype
+        self.workers = workers
+        self.bgr = bgr
+        self.queue_size = queue_size
+        self.image_array = None
+
+        for stage in self.pipeline.stages:
+            # Build lookup tables now rather than on the first frame
+            getattr(stage, "lut", None)
+
+    def process(self, frame: np.ndarray) -> np.ndarray:
+        """Filter a single frame and return the result as a new array."""
+        if self.bgr:
+            if frame.shape[-1] != 3:
+                raise FimageException("BGR frames must have 3 channels.")
+            # A reversed view puts channels in RGB order without copying
+            frame = frame[..., ::-1]
+
+        if self.image_array is None:
+            self.image_array = ImageArray(frame, dtype=self.dtype)
+        else:
+            self.image_array.reset(frame)
+        self.pipeline.process(self.image_array, workers=self.workers)
+
+        out = np.empty(frame.shape, dtype=np.uint8)
+        self.image_array.get_current(out[..., ::-1] if self.bgr else out)
+        return out
+
+    def __call__(self, frames: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+        """Yield the filtered frames, in order.
+
+        Frames are pulled from `frames` on one thread and filtered on another,
+        up to `queue_size` frames ahead of the consumer, so decoding, filtering
+        and whatever the caller does with each result, e.g. encoding, overlap.
+        """
+        stop = threading.Event()
+        decoded = queue.Queue(self.queue_size)
+        filtered = queue.Queue(self.queue_size)
+
+        def put(target: queue.Queue, item) -> bool:
+            while not stop.is_set():
+                try:
+                    target.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def get(source: queue.Queue):
+            while not stop.is_set():
+                try:
+                    return source.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return _END
+
+        def decode():
+            try:
+                for frame in frames:
+                    if not put(decoded, frame):
+                        return
+            except BaseException as exception:
+                put(decoded, _Failure(exception))
+                return
+            put(decoded, _END)
+
+        def filter_():
+            while True:
+                frame = get(decoded)
+                if frame is _END or isinstance(frame, _Failure):
+                    put(filtered, frame)
+                    return
+                try:
+                    result = self.process(frame)
+                except BaseException as exception:
+                    put(filtered, _Failure(exception))
+                    return
+                if not put(filtered, result):
+                    return
+
+        threads = [
+            threading.Thread(target=decode, name="fimage-decode", daemon=True),
+            threading.Thread(target=filter_, name="fimage-filter", daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                result = filtered.get()
+                if result is _END:
+                    return
+                if isinstance(result, _Failure):
+                    raise result.exception
+                yield result
+        finally:
+            # Also reached when the consumer stops iterating early
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+
+def process_frames(
+    frames: Iterable[np.ndarray], filters, **kwargs
+) -> Iterator[np.ndarray]:
+    """Yield filtered frames, see `FrameStream` for the keyword arguments."""
+    return FrameStream(filters, **kwargs)(frames)
+
+
+def read_video(source, bgr: bool = False) -> Iterator[np.ndarray]:
+    """Yield the frames of a video file or camera index read with OpenCV.
+
+    Frames are converted to RGB unless `bgr` is set, in which case they should
+    be filtered with `FrameStream(..., bgr=True)`.
+    """
+    import cv2
+
+    capture = cv2.VideoCapture(source)
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            yield frame if bgr else cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    finally:
+        capture.release()
@@ -0,0 +1,266 @@
+"""Process images larger than memory in row tiles backed by np.memmap.
+
+The source frame is read from a memory-mapped array and every tile of rows
+goes through the whole filter chain before its result is written to a
+memory-mapped output, so peak memory depends on the tile size rather than on
+the image size.
+"""
+
+import os
+import struct
+import tempfile
+from typing import Iterable, Optional
+
+import numpy as np
+
+from fimage.exceptions import FimageException
+from fimage.filters import HistogramFilter
+from fimage.image_array import ImageArray
+from fimage.pipeline import Pipeline, compile_pipeline
+
+# Pixels per tile when no number of rows is given
+TILE_PIXELS = 1 << 20
+
+# Rows per strip in the TIFF files written by `create_tiff`
+TIFF_STRIP_ROWS = 64
+
+TIFF_SHORT = 3
+TIFF_LONG = 4
+
+
+def tile_rows_for(width: int, tile_pixels: int = TILE_PIXELS) -> int:
+    return max(1, tile_pixels // max(1, width))
+
+
+def decode_to_memmap(source, path: str, tile_rows: Optional[int] = None) -> np.memmap:
+    """Decode an image into a .npy file and return it memory-mapped.
+
+    Pillow holds the decoded uint8 frame once while it is copied, in strips of
+    `tile_rows` rows, into the file; no other full-size array is created.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        width, height = image.size
+        frame = np.lib.format.open_memmap(
+            path,
+            mode="w+",
+            dtype=np.uint8,
+            shape=(height, width, len(image.getbands())),
+        )
+        step = tile_rows or tile_rows_for(width)
+        for start in range(0, height, step):
+            stop = min(start + step, height)
+            frame[start:stop] = np.asarray(image.crop((0, start, width, stop)))
+
+    frame.flush()
+    return frame
+
+
+def _tiff_ifd(entries) -> bytes:
+    """Pack an image file directory starting at offset 8, followed by the
+    values that do not fit in their entries."""
+    data_offset = 8 + 2 + 12 * len(entries) + 4
+    ifd = bytearray(struct.pack("<H", len(entries)))
+    data = bytearray()
+
+    for tag, type_, values in entries:
+        fmt = "H" if type_ == TIFF_SHORT else "I"
+        packed = struct.pack(f"<{len(values)}{fmt}", *values)
+        ifd += struct.pack("<HHI", tag, type_, len(values))
+        if len(packed) <= 4:
+            ifd += packed.ljust(4, b"\0")
+        else:
+            ifd += struct.pack("<I", data_offset + len(data))
+            data += packed
+
+    ifd += struct.pack("<I", 0)
+    return bytes(ifd + data)
+
+
+def create_tiff(path: str, shape) -> np.memmap:
+    """Create an uncompressed RGB(A) TIFF file and memory-map its pixels.
+
+    The pixels are stored contiguously after the header, so writing into the
+    returned (height, width, channels) array writes the image in place.
+    """
+    height, width, channels = shape
+    if channels not in (3, 4):
+        raise FimageException(f"Cannot write a TIFF file with {channels} channels.")
+
+    row_bytes = width * channels
+    strips = range(0, height, TIFF_STRIP_ROWS)
+
+    def entries(pixel_offset):
+        entries = [
+            (256, TIFF_LONG, [width]),
+            (257, TIFF_LONG, [height]),
+            (258, TIFF_SHORT, [8] * channels),
+            # No compression, RGB
+            (259, TIFF_SHORT, [1]),
+            (262, TIFF_SHORT, [2]),
+            (273, TIFF_LONG, [pixel_offset + row * row_bytes for row in strips]),
+            (277, TIFF_SHORT, [channels]),
+            (278, TIFF_LONG, [TIFF_STRIP_ROWS]),
+            (
+                279,
+                TIFF_LONG,
+                [min(TIFF_STRIP_ROWS, height - row) * row_bytes for row in strips],
+            ),
+            # Channels interleaved
+            (284, TIFF_SHORT, [1]),
+        ]
+        if channels == 4:
+            # Unassociated alpha
+            entries.append((338, TIFF_SHORT, [2]))
+        return entries
+
+    # The directory has the same size whatever the offsets are
+    pixel_offset = 8 + len(_tiff_ifd(entries(0)))
+    pixel_offset += -pixel_offset % 16
+    if pixel_offset + height * row_bytes >= 2**32:
+        raise FimageException("Image is too large for a TIFF file, use .npy instead.")
+
+    with open(path, "wb") as file:
+        file.write(b"II*\0" + struct.pack("<I", 8))
+        file.write(_tiff_ifd(entries(pixel_offset)).ljust(pixel_offset - 8, b"\0"))
+        file.truncate(pixel_offset + height * row_bytes)
+
+    return np.memmap(path, dtype=np.uint8, mode="r+", offset=pixel_offset, shape=shape)
+
+
+def open_output(output, shape) -> np.ndarray:
+    """Return a writable array for `output`: an array, a .npy or a .tif path."""
+    if isinstance(output, np.ndarray):
+        if output.shape != tuple(shape):
+            raise FimageException(
+                f"Output shape {output.shape} does not match {tuple(shape)}."
+            )
+        return output
+
+    output = os.fspath(output)
+    if output.lower().endswith((".tif", ".tiff")):
+        return create_tiff(output, shape)
+    return np.lib.format.open_memmap(output, mode="w+", dtype=np.uint8, shape=shape)
+
+
+def process_tiled(
+    source: np.ndarray,
+    filters: Iterable,
+    output,
+    tile_rows: Optional[int] = None,
+    dtype=None,
+    workers: int = 1,
+    fixed_point: Optional[bool] = None,
+) -> np.ndarray:
+    """Run filters over a (height, width, channels) uint8 array tile by tile.
+
+    `source` is typically a read-only np.memmap. `output` is an array of the
+    same shape, or a path to a .npy or .tif file created for the result,
+    which is returned. Each tile carries the halo rows its neighbourhood
+    filters need, so the result matches processing the whole frame at once.
+    Filters that cannot be banded, like unseeded Noise, are run on each tile
+    alone.
+
+    Auto filters reading histograms need those of the whole image as it is
+    when they run. The filters before each of them are run over every tile
+    first, into a temporary file next to the output, then the histograms of
+    that result are counted and the rest of the chain follows from there.
+
+    With more than one worker tiles are processed in a thread pool, holding
+    up to `workers` tiles in memory at a time. `dtype` and `fixed_point` are
+    those of ImageArray.
+    """
+    passes = [[]]
+    for stage in compile_pipeline(filters).stages:
+        if isinstance(stage, HistogramFilter) and passes[-1]:
+            passes.append([])
+        passes[-1].append(stage)
+
+    output = open_output(output, source.shape)
+    if len(passes) == 1:
+        return _process_pass(
+            passes[0], source, output, tile_rows, dtype, workers, fixed_point
+        )
+
+    directory = os.path.dirname(getattr(output, "filename", None) or "") or None
+    with tempfile.TemporaryDirectory(dir=directory) as temporary:
+        for index, stages in enumerate(passes):
+            target = output
+            if index < len(passes) - 1:
+                target = np.lib.format.open_memmap(
+                    os.path.join(temporary, f"pass_{index}.npy"),
+                    mode="w+",
+                    dtype=np.uint8,
+                    shape=source.shape,
+                )
+            source = _process_pass(
+                stages, source, target, tile_rows, dtype, workers, fixed_point
+            )
+    return output
+
+
+def _process_pass(stages, source, output, tile_rows, dtype, workers, fixed_point):
+    """Run `stages` over `source` tile by tile, writing them to `output`."""
+    if stages and isinstance(stages[0], HistogramFilter):
+        # Counted over the whole source, sampled as for a single ImageArray
+        histograms = ImageArray(source).histograms(stages[0].samples)
+        stages = [stages[0].with_histograms(histograms)] + stages[1:]
+    pipeline = Pipeline(stages)
+
+    rows, width = source.shape[:2]
+    tile_rows = tile_rows or tile_rows_for(width)
+    halo = sum(stage.halo or 0 for stage in pipeline.stages)
+
+    def process_tile(start):
+        stop = min(start + tile_rows, rows)
+        top = max(0, start - halo)
+        bottom = min(rows, stop + halo)
+
+        image_array = ImageArray(
+            np.array(source[top:bottom]), dtype=dtype, fixed_point=fixed_point
+        )
+        image_array.row_offset = top
+        image_array.full_rows = rows
+        pipeline.process(image_array)
+        output[start:stop] = image_array.get_current()[start - top : stop - top]
+
+    if workers <= 1:
+        for start in range(0, rows, tile_rows):
+            process_tile(start)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(process_tile, range(0, rows, tile_rows)))
+
+    if isinstance(output, np.memmap):
+        output.flush()
+    return output
+
+
+def process_file(
+    source,
+    filters: Iterable,
+    output,
+    tile_rows: Optional[int] = None,
+    dtype=None,
+    workers: int = 1,
+    fixed_point: Optional[bool] = None,
+) -> np.ndarray:
+    """Decode an image to a temporary memmap and filter it with `process_tiled`."""
+    directory = None
+    if not isinstance(output, np.ndarray):
+        # Keep the decoded frame on the same disk as the output
+        directory = os.path.dirname(os.fspath(output)) or None
+    with tempfile.TemporaryDirectory(dir=directory) as temporary:
+        frame = decode_to_memmap(
+            source, os.path.join(temporary, "source.npy"), tile_rows
+        )
+        return process_tiled(
+            frame, filters, output, tile_rows, dtype, workers, fixed_point
+        )
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+
+@pytest.fixture
+def channels():
+    return 3
+
+
+@pytest.fixture
+def random_array(channels):
+    rng = np.random.default_rng(7)
+    return rng.integers(0, 256, (64, 48, channels), dtype=np.uint8)
+
+
+@pytest.fixture
+def image_format():
+    return "PNG"
+
+
+@pytest.fixture
+def image_path(tmp_path, random_array, image_format):
+    path = tmp_path / f"image.{image_format.lower()}"
+    Image.fromarray(random_array).save(path, image_format)
+    return path
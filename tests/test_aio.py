@@ -0,0 +1,85 @@
+import asyncio
+import functools
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from fimage import aio
+from fimage.filters import Contrast, Sepia
+from fimage.fimage import FImage
+
+
+def test_async_matches_sync(image_path, tmp_path):
+    async def main():
+        image = await FImage.aopen(image_path, limiter=aio.MegapixelLimiter(1))
+        await image.aapply(Sepia(90), contrast=20)
+        await image.asave(tmp_path / "async.png")
+        return image
+
+    image = asyncio.run(main())
+    assert image.limiter.in_flight == 0
+
+    expected = FImage(image_path)
+    expected.apply(Sepia(90), Contrast(20))
+    np.testing.assert_equal(image.to_ndarray(), expected.to_ndarray())
+    result = np.asarray(Image.open(tmp_path / "async.png"))
+    np.testing.assert_equal(result, expected.to_ndarray())
+
+
+def test_limiter_bounds_megapixels_in_flight():
+    limiter = aio.MegapixelLimiter(2.5)
+    peaks = []
+    lock = threading.Lock()
+
+    def work(megapixels):
+        with lock:
+            peaks.append(limiter.in_flight)
+        time.sleep(0.02)
+        return megapixels
+
+    async def main():
+        sizes = [1, 1, 1, 4, 1]
+        return await asyncio.gather(
+            *(
+                aio.run(functools.partial(work, size), size, limiter=limiter)
+                for size in sizes
+            )
+        )
+
+    assert asyncio.run(main()) == [1, 1, 1, 4, 1]
+    # Larger images than the budget run alone
+    assert max(peaks) == 4
+    assert all(peak <= 2.5 for peak in peaks if peak != 4)
+    assert limiter.in_flight == 0
+
+
+def test_cancelled_waiter_lets_others_through():
+    limiter = aio.MegapixelLimiter(1)
+
+    async def main():
+        await limiter.acquire(1)
+        blocked = asyncio.ensure_future(limiter.acquire(1))
+        await asyncio.sleep(0)
+        blocked.cancel()
+        limiter.release(1)
+        await asyncio.wait_for(limiter.acquire(1), 1)
+
+    asyncio.run(main())
+    assert limiter.in_flight == 1
+
+
+def test_limiter_does_not_drift():
+    limiter = aio.MegapixelLimiter(1)
+
+    async def main():
+        await limiter.acquire(0.1)
+        await limiter.acquire(0.2)
+        limiter.release(0.1)
+        limiter.release(0.2)
+        # Nothing is in flight, so an image over the budget runs
+        await asyncio.wait_for(limiter.acquire(3.3), 1)
+
+    asyncio.run(main())
+    assert limiter.in_flight == 3.3
@@ -0,0 +1,146 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from fimage.batch import (
+    expand_sources,
+    output_path,
+    process_batch,
+    process_stack,
+    to_specs,
+)
+from fimage.class_register import ClassMapRegister
+from fimage.exceptions import FimageException
+from fimage.filters import (
+    Channels,
+    Colorize,
+    Contrast,
+    Curves,
+    Hue,
+    Noise,
+    Saturation,
+    Sepia,
+    Sharpen,
+)
+from fimage.fimage import FImage
+from fimage.image_array import ImageArray
+from fimage.pipeline import compile_pipeline
+from fimage.presets import Love, OrangePeel, SinCity
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    rng = np.random.default_rng(5)
+    for index in range(4):
+        ndarray = rng.integers(0, 256, (20 + index, 16, 3), dtype=np.uint8)
+        Image.fromarray(ndarray).save(tmp_path / f"image_{index}.png")
+    (tmp_path / "broken.png").write_bytes(b"not an image")
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    "filter_",
+    [
+        Contrast(20),
+        Contrast(adjust=-10),
+        Channels({"R": 20}),
+        Curves((0, 0), (100, 50), (140, 200), (255, 255)),
+        SinCity(),
+    ],
+)
+def test_spec_round_trip(filter_):
+    name, args = filter_.spec
+    rebuilt = ClassMapRegister.get_class(name, args)
+    assert type(rebuilt) is type(filter_)
+    assert rebuilt.spec == filter_.spec
+    if hasattr(filter_, "adjust"):
+        assert rebuilt.adjust == filter_.adjust
+
+
+def test_to_specs():
+    assert to_specs("sincity") == [("sincity", None)]
+    assert to_specs(SinCity) == [("sincity", None)]
+    assert to_specs([Sepia(40), ("contrast", 10)]) == [
+        ("sepia", (40,)),
+        ("contrast", 10),
+    ]
+
+
+def test_output_path():
+    pattern = "{parent}/out/{stem}_{index}{suffix}"
+    assert output_path(pattern, "in/a.jpg", 3) == "in/out/a_3.jpg"
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_process_batch(image_dir, workers):
+    output = str(image_dir / "out" / "{stem}.png")
+    results = list(
+        process_batch(
+            image_dir / "*.png", [Sepia(40), "sincity"], output, workers=workers
+        )
+    )
+
+    assert len(results) == 5
+    failed = [result for result in results if not result.ok]
+    assert [result.source for result in failed] == [str(image_dir / "broken.png")]
+
+    for result in results:
+        if result.ok:
+            assert set(result.timings) == {"decode", "filter", "encode"}
+            expected = FImage(result.source)
+            expected.apply(Sepia(40), SinCity())
+            np.testing.assert_equal(
+                np.array(Image.open(result.output)), np.array(expected.image)
+            )
+
+
+def test_expand_sources_directory(image_dir):
+    assert len(expand_sources(image_dir)) == 5
+    assert expand_sources(["b.png", "a.png"]) == ["b.png", "a.png"]
+
+
+STACK_FILTERS = [
+    Contrast(20),
+    Colorize(196, 32, 7, 30),
+    Hue(30),
+    Saturation(-20),
+    Sharpen(40),
+    Noise(20, seed=5),
+    Love,
+    OrangePeel,
+    SinCity,
+]
+
+
+@pytest.mark.parametrize("channels", [3, 4])
+@pytest.mark.parametrize("dtype, workers", [(None, 1), (np.int16, 1), (None, 3)])
+def test_process_stack_matches_single_images(channels, dtype, workers):
+    rng = np.random.default_rng(12)
+    stack = rng.integers(0, 256, (40, 9, 11, channels), dtype=np.uint8)
+
+    result = process_stack(stack, STACK_FILTERS, dtype=dtype, workers=workers)
+
+    assert result.shape == stack.shape
+    for image, filtered in zip(stack, result):
+        image_array = ImageArray(image.copy(), dtype=dtype)
+        compile_pipeline(STACK_FILTERS).process(image_array)
+        np.testing.assert_equal(filtered, image_array.get_current())
+
+
+def test_process_stack_unseeded_noise_matches_single_images():
+    rng = np.random.default_rng(13)
+    stack = rng.integers(0, 256, (3, 9, 11, 3), dtype=np.uint8)
+
+    np.random.seed(1)
+    result = process_stack(stack, [Noise(20)])
+
+    np.random.seed(1)
+    for image, filtered in zip(stack, result):
+        image_array = ImageArray(image.copy())
+        Noise(20).process(image_array)
+        np.testing.assert_equal(filtered, image_array.get_current())
+
+
+def test_process_stack_needs_a_stack():
+    with pytest.raises(FimageException):
+        process_stack(np.zeros((4, 4, 3), dtype=np.uint8), [Sepia()])
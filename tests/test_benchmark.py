@@ -0,0 +1,53 @@
+import json
+
+from fimage.benchmark import compare, main, registered_names, run
+
+
+def test_run_covers_every_registered_name():
+    report = run(sizes=["24x16"], repeat=1)
+    names = {result["name"] for result in report["results"]}
+
+    assert names == set(registered_names())
+    assert {"love", "sepia", "sharpen"} <= names
+    assert len(report["results"]) == 2 * len(names)
+    for result in report["results"]:
+        assert result["mp_per_s"] > 0
+        assert result["peak_bytes"] > 0
+        assert len(result["stages"]) >= 1
+
+
+def test_compare_reports_regressions():
+    baseline = run(["sepia", "love"], sizes=["24x16"], modes=["RGB"], repeat=1)
+    report = json.loads(json.dumps(baseline))
+    assert compare(report, baseline) == []
+
+    report["results"][0]["mp_per_s"] /= 2
+    report["results"][1]["peak_bytes"] *= 2
+    regressions = compare(report, baseline, threshold=0.1)
+    assert [(r["name"], r["metric"]) for r in regressions] == [
+        ("sepia", "mp_per_s"),
+        ("love", "peak_bytes"),
+    ]
+
+
+def test_main_writes_report(tmp_path):
+    output = tmp_path / "report.json"
+    argv = ["-f", "contrast", "--sizes", "24x16", "--modes", "RGBA", "-r", "1"]
+    assert main(argv + ["-o", str(output)]) == 0
+
+    report = json.loads(output.read_text())
+    assert [result["mode"] for result in report["results"]] == ["RGBA"]
+    assert (
+        main(
+            argv
+            + [
+                "-o",
+                str(tmp_path / "new.json"),
+                "--threshold",
+                "100",
+                "--baseline",
+                str(output),
+            ]
+        )
+        == 0
+    )
@@ -0,0 +1,89 @@
+import numpy as np
+from PIL import Image
+
+from fimage.cache import DiskCache, MemoryCache, signature
+from fimage.filters import ColorMatrix, Contrast, Noise, Sepia
+from fimage.fimage import FImage
+from fimage.presets import Love
+
+
+def frame(value, size=10):
+    return np.full((size, size, 3), value, dtype=np.uint8)
+
+
+def test_signature():
+    assert signature([Contrast(20), Love]) == signature([Contrast(20), Love()])
+    assert signature([Contrast(20)]) != signature([Contrast(21)])
+    assert signature([Contrast(20), Sepia()]) != signature([Sepia(), Contrast(20)])
+    assert signature([Contrast(20), Noise(10)]) is None
+    assert signature([Noise(10, seed=1)]) != signature([Noise(10, seed=2)])
+
+
+def test_signature_keeps_array_precision():
+    matrix = np.eye(3)
+    close = matrix.copy()
+    close[0, 0] = 1.000000001
+    assert signature([ColorMatrix(matrix)]) != signature([ColorMatrix(close)])
+    assert signature([ColorMatrix(matrix)]) == signature([ColorMatrix(np.eye(3))])
+    assert signature([ColorMatrix(matrix)]) != signature(
+        [ColorMatrix(matrix.astype(np.float32))]
+    )
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_bytes=3 * frame(0).nbytes)
+    for value in range(3):
+        cache.put(str(value), frame(value))
+    cache.get("0")
+    cache.put("3", frame(3))
+
+    assert cache.get("1") is None
+    np.testing.assert_equal(cache.get("0"), frame(0))
+    assert cache.size == 3 * frame(0).nbytes
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_disk_cache_evicts_past_max_bytes(tmp_path):
+    # Leave room for the .npy headers
+    cache = DiskCache(tmp_path, max_bytes=2 * frame(0, 64).nbytes + 1024)
+    for value in range(3):
+        cache.put(str(value), frame(value, 64))
+
+    assert cache.get("0") is None
+    np.testing.assert_equal(cache.get("2"), frame(2, 64))
+    assert len(list(tmp_path.glob("*.npy"))) == 2
+
+
+def test_fimage_uses_cache(tmp_path):
+    path = tmp_path / "image.png"
+    rng = np.random.default_rng(2)
+    Image.fromarray(rng.integers(0, 256, (32, 48, 3), dtype=np.uint8)).save(path)
+    cache = MemoryCache()
+
+    first = FImage(path, cache=cache)
+    first.apply(Contrast(20))
+    first.apply(Love)
+    second = FImage(path, cache=cache)
+    second.apply(Contrast(20))
+    second.apply(Love)
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    uncached = FImage(path)
+    uncached.apply(Contrast(20), Love)
+    np.testing.assert_equal(np.asarray(second.image), np.asarray(uncached.image))
+    np.testing.assert_equal(np.asarray(first.image), np.asarray(uncached.image))
+
+    # Noise draws new values every time, so its results are never cached
+    second.apply(Noise(10))
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_cache_keys_depend_on_arithmetic_mode(tmp_path):
+    path = tmp_path / "image.png"
+    Image.fromarray(np.zeros((4, 4, 3), dtype=np.uint8)).save(path)
+    cache = MemoryCache()
+    keys = {
+        FImage(path, cache=cache, **kwargs).cache_key([Sepia()])
+        for kwargs in ({}, {"fixed_point": True}, {"dtype": np.int16})
+    }
+    assert len(keys) == 3
@@ -0,0 +1,96 @@
+import io
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from fimage.cli import main, parse_args_value
+from fimage.filters import Contrast
+from fimage.fimage import FImage
+from fimage.presets import SinCity
+
+
+def expected_array(path):
+    image = FImage(path)
+    image.apply(Contrast(20), SinCity())
+    return np.array(image.image)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("20", 20),
+        ("1.3", 1.3),
+        ("196,32,7,30", (196, 32, 7, 30)),
+        ("0:0,100:50", ((0, 0), (100, 50))),
+        ('[{"R": 20}]', ({"R": 20},)),
+        ('{"adjust": 5}', {"adjust": 5}),
+    ],
+)
+def test_parse_args_value(value, expected):
+    assert parse_args_value(value) == expected
+
+
+def test_files(image_path, tmp_path, capsys):
+    output = str(tmp_path / "out" / "{stem}_new.png")
+    assert (
+        main(
+            [
+                str(image_path),
+                "-f",
+                "contrast=20",
+                "-p",
+                "sincity",
+                "-o",
+                output,
+                "--bench",
+            ]
+        )
+        == 0
+    )
+
+    result = Image.open(tmp_path / "out" / "image_new.png")
+    np.testing.assert_equal(np.array(result), expected_array(image_path))
+    assert "filter=" in capsys.readouterr().err
+
+
+def test_stdin_to_stdout(image_path, monkeypatch):
+    stdin = io.TextIOWrapper(io.BytesIO(image_path.read_bytes()))
+    stdout = io.TextIOWrapper(io.BytesIO())
+    monkeypatch.setattr(sys, "stdin", stdin)
+    monkeypatch.setattr(sys, "stdout", stdout)
+
+    assert main(["--filter", "contrast=20", "--preset", "sincity"]) == 0
+
+    result = Image.open(io.BytesIO(stdout.buffer.getvalue()))
+    assert result.format == "PNG"
+    np.testing.assert_equal(np.array(result), expected_array(image_path))
+
+
+def test_unknown_filter(capsys):
+    with pytest.raises(SystemExit):
+        main(["--filter", "unknown"])
+    assert "unknown filter" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("filter_", ["curves=0:0", "posterize=1"])
+def test_invalid_filter_arguments(filter_, capsys):
+    with pytest.raises(SystemExit):
+        main(["--filter", filter_])
+    assert "invalid filter arguments" in capsys.readouterr().err
+
+
+def test_stdout_needs_a_file(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        main([str(tmp_path), "-f", "sepia"])
+    assert "needs an image file" in capsys.readouterr().err
+
+
+def test_stdin_that_is_not_an_image(monkeypatch, capsys):
+    stdin = io.TextIOWrapper(io.BytesIO(b"not an image"))
+    monkeypatch.setattr(sys, "stdin", stdin)
+
+    assert main(["-f", "sepia"]) == 1
+    err = capsys.readouterr().err
+    assert err.startswith("fimage: stdin: ") and "Traceback" not in err
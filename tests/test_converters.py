@@ -1,7 +1,13 @@
 import numpy as np
 import pytest
 
-from fimage.converters import hsv2rgb, rgb2hsv
+from fimage.converters import (
+    hsv2rgb,
+    hsv2rgb_float32,
+    rgb2hsv,
+    rgb2hsv_float32,
+    rotate_hue,
+)
 
 
 @pytest.fixture
@@ -52,3 +58,52 @@ def test_hsv2rgb(initial_hsv_array):
         ]
     )
     np.testing.assert_allclose(rgb_array, desired_array, atol=0.5)
+
+
+@pytest.fixture
+def random_rgb_array():
+    rng = np.random.default_rng(0)
+    rgb = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    # Greys, primaries and ties between channels
+    rgb[0, :8] = [
+        [0, 0, 0],
+        [255, 255, 255],
+        [10, 10, 10],
+        [255, 0, 0],
+        [0, 255, 0],
+        [0, 0, 255],
+        [255, 255, 0],
+        [255, 0, 255],
+    ]
+    return rgb
+
+
+def test_rgb2hsv_float32(random_rgb_array):
+    hsv_array = rgb2hsv_float32(random_rgb_array)
+    assert hsv_array.dtype == np.float32
+    np.testing.assert_allclose(hsv_array, rgb2hsv(random_rgb_array), atol=1e-6)
+
+
+def test_rgb2hsv_float32_out(random_rgb_array):
+    out = np.empty(random_rgb_array.shape, dtype=np.float32)
+    assert rgb2hsv_float32(random_rgb_array, out=out) is out
+
+
+def test_hsv2rgb_float32():
+    hsv_array = np.random.default_rng(1).random((64, 64, 3))
+    rgb_array = hsv2rgb_float32(hsv_array)
+    assert rgb_array.dtype == np.float32
+    np.testing.assert_allclose(rgb_array, hsv2rgb(hsv_array.copy()), atol=1e-6)
+
+
+@pytest.mark.parametrize("shift", [0, 0.25, 0.5, 0.99])
+def test_rotate_hue(random_rgb_array, shift):
+    hsv_array = rgb2hsv(random_rgb_array)
+    hsv_array[..., 0] = (hsv_array[..., 0] + shift) % 1
+    expected = hsv2rgb(hsv_array) * 255
+
+    np.testing.assert_allclose(rotate_hue(random_rgb_array, shift), expected, atol=1e-3)
+
+
+def test_rotate_hue_by_zero_keeps_values(random_rgb_array):
+    np.testing.assert_equal(np.rint(rotate_hue(random_rgb_array, 0)), random_rgb_array)
@@ -1,8 +1,31 @@
+import cv2
 import numpy as np
 import pytest
 
-from fimage.filters import Brightness, FillColor, Grayscale, Hue, Saturation, Sepia
+from fimage.class_register import ClassMapRegister
+from fimage.converters import hsv2rgb, rgb2hsv
+from fimage.exceptions import FilterException
+from fimage.filters import (
+    AutoContrast,
+    AutoLevels,
+    AutoWhiteBalance,
+    BoxBlur,
+    Brightness,
+    ColorMatrix,
+    Curves,
+    Exposure,
+    FillColor,
+    GaussianBlur,
+    Grayscale,
+    Hue,
+    Saturation,
+    Sepia,
+    SwapChannels,
+    Vignette,
+    _curve_table,
+)
 from fimage.image_array import ImageArray
+from fimage.lut import apply_lut, compose_luts
 
 
 @pytest.fixture
@@ -50,6 +73,22 @@ def test_saturation(initial_image_array):
     np.testing.assert_equal(initial_image_array.get_current(), desire_array)
 
 
+@pytest.mark.parametrize("adjust", [-100, -30, 30, 150])
+@pytest.mark.parametrize("dtype", [None, np.int16, np.float32])
+def test_saturation_matches_float64_formula(adjust, dtype):
+    rng = np.random.default_rng(8)
+    ndarray = rng.integers(0, 256, (40, 50, 3), dtype=np.uint8)
+    channels = ndarray.astype(np.float64)
+    maximum = channels.max(axis=-1, keepdims=True)
+    expected = np.clip(
+        np.trunc(channels + (maximum - channels) * adjust * -0.01), 0, 255
+    )
+
+    image_array = ImageArray(ndarray, dtype=dtype)
+    Saturation(adjust).process(image_array)
+    np.testing.assert_equal(image_array.get_current(), expected)
+
+
 def test_grayscale(initial_image_array):
     Grayscale().process(initial_image_array)
     desire_array = [
@@ -68,6 +107,65 @@ def test_sepia(initial_image_array):
     np.testing.assert_equal(initial_image_array.get_current(), desire_array)
 
 
+def test_color_matrix(initial_image_array):
+    ColorMatrix([[0.5, 0, 0, 10], [0, 1, 0, -20], [0, 0, 1.5, 0.5]]).process(
+        initial_image_array
+    )
+    desire_array = [
+        [[133, 160, 255], [12, 0, 18]],
+        [[32, 50, 105], [82, 115, 15]],
+    ]
+    np.testing.assert_equal(initial_image_array.get_current(), desire_array)
+
+    with pytest.raises(FilterException):
+        ColorMatrix([[1, 0], [0, 1]])
+
+
+@pytest.mark.parametrize("dtype", [None, np.int16, np.float32])
+def test_swap_channels(initial_image_array, dtype):
+    ndarray = initial_image_array.original_array
+    image_array = ImageArray(ndarray, dtype=dtype)
+    SwapChannels("BGR").process(image_array)
+    np.testing.assert_equal(image_array.get_current(), ndarray[..., ::-1])
+
+    with pytest.raises(FilterException):
+        SwapChannels("RGA")
+
+
+def test_sepia_matches_sequential_formula():
+    rng = np.random.default_rng(3)
+    ndarray = rng.integers(0, 256, (64, 64, 3)).astype(np.float64)
+    R, G, B = (ndarray[..., index] for index in range(3))
+    # New G from the new R, and new B from the new R and G
+    R = R * 0.393 + G * 0.769 + B * 0.189
+    G = R * 0.349 + G * 0.686 + B * 0.168
+    B = R * 0.272 + G * 0.534 + B * 0.131
+    expected = np.clip(np.trunc(np.stack([R, G, B], axis=-1)), 0, 255)
+
+    image_array = ImageArray(ndarray.astype(np.uint8))
+    Sepia().process(image_array)
+    np.testing.assert_allclose(image_array.get_current(), expected, atol=1)
+
+
+@pytest.mark.parametrize("dtype", [None, np.int16, np.float32])
+def test_grayscale_white_stays_white(dtype):
+    # Rounding must not depend on the position of the pixel in the array
+    image_array = ImageArray(np.full((1, 5, 3), 255, dtype=np.uint8), dtype=dtype)
+    Grayscale().process(image_array)
+    assert (image_array.get_current() == 255).all()
+
+
+def test_color_matrix_does_not_depend_on_position():
+    rng = np.random.default_rng(14)
+    ndarray = rng.integers(0, 256, (1, 4099, 3), dtype=np.uint8)
+    whole = ImageArray(ndarray)
+    Sepia(80).process(whole)
+    # The same pixels shifted by one position
+    shifted = ImageArray(ndarray[:, 1:].copy())
+    Sepia(80).process(shifted)
+    np.testing.assert_equal(whole.get_current()[:, 1:], shifted.get_current())
+
+
 def test_hue(initial_image_array):
     Hue(50).process(initial_image_array)
     desire_array = [
@@ -77,3 +175,137 @@ def test_hue(initial_image_array):
     np.testing.assert_allclose(
         initial_image_array.get_current(), desire_array, atol=1.0
     )
+
+
+def test_hue_matches_hsv_round_trip():
+    rng = np.random.default_rng(2)
+    ndarray = rng.integers(0, 256, (32, 32, 3), dtype=np.uint8)
+    image_array = ImageArray(ndarray)
+    Hue(30).process(image_array)
+
+    hsv = rgb2hsv(ndarray)
+    hsv[..., 0] = (hsv[..., 0] * 100 + 30) % 100 / 100
+    expected = hsv2rgb(hsv) * 255
+    np.testing.assert_allclose(image_array.get_current(), expected, atol=1.0)
+
+
+def test_curves_table():
+    table = Curves((0, 0), (100, 50), (140, 200), (255, 255)).table
+    np.testing.assert_equal(
+        table[[0, 50, 100, 128, 200, 255]], [0, 37, 96, 134, 218, 255]
+    )
+    np.testing.assert_equal(Curves((0, 0), (255, 255)).table, np.arange(256))
+
+
+def test_curves_any_number_of_points():
+    points = [(0, 0), (64, 100), (128, 128), (192, 160), (255, 255)]
+    table = Curves(points).table
+    np.testing.assert_equal(table, Curves(*points).table)
+    np.testing.assert_equal(table[[0, 64, 128, 192, 255]], [0, 78, 129, 181, 255])
+    assert np.all(np.diff(table) >= 0)
+
+    with pytest.raises(FilterException):
+        Curves((0, 0))
+
+
+def test_curves_keyword_points():
+    points = ((0, 0), (100, 50), (140, 200), (255, 255))
+    curves = ClassMapRegister.get_class(
+        "curves", dict(zip(("p0", "p1", "p2", "p3"), points))
+    )
+    np.testing.assert_equal(curves.table, Curves(*points).table)
+    assert curves.p2 == (140, 200)
+    assert curves.curve == curves.calculate_bezier(1000)
+    assert curves.curve[120] == curves.table[120]
+    filled = curves.missing_values({0: 0, 10: 20})
+    assert [filled[i] for i in (0, 5, 10, 255)] == [0, 10, 20, 20]
+
+    with pytest.raises(FilterException):
+        Curves((0, 0), (255, 255), p0=(0, 0))
+
+
+def test_curve_tables_are_cached():
+    Exposure(20)
+    hits = _curve_table.cache_info().hits
+    np.testing.assert_equal(Exposure(20).curves.table, Exposure(20.0).curves.table)
+    assert _curve_table.cache_info().hits == hits + 2
+
+
+def test_blurs_match_opencv():
+    rng = np.random.default_rng(6)
+    ndarray = rng.integers(0, 256, (40, 50, 3), dtype=np.uint8)
+
+    image_array = ImageArray(ndarray)
+    BoxBlur(2).process(image_array)
+    np.testing.assert_equal(image_array.get_current(), cv2.blur(ndarray, (5, 5)))
+
+    image_array = ImageArray(ndarray)
+    ClassMapRegister.get_class("gaussianblur", (3, 1.5)).process(image_array)
+    np.testing.assert_allclose(
+        image_array.get_current(),
+        cv2.GaussianBlur(ndarray, (7, 7), 1.5),
+        atol=1,
+    )
+
+    with pytest.raises(FilterException):
+        GaussianBlur(-1)
+
+
+def test_vignette_darkens_corners():
+    image_array = ImageArray(np.full((41, 61, 3), 200, dtype=np.uint8))
+    Vignette(50, 40).process(image_array)
+    result = image_array.get_current()
+    assert (result[20, 30] == 200).all()
+    assert 100 <= result[0, 0, 0] < 110
+    assert result[0, 30, 0] > result[0, 0, 0]
+
+
+def test_auto_filters_stretch_and_balance():
+    rng = np.random.default_rng(9)
+    ndarray = rng.integers(60, 180, (30, 40, 3), dtype=np.uint8)
+    ndarray[..., 2] //= 2
+
+    image_array = ImageArray(ndarray)
+    AutoContrast(clip=0).process(image_array)
+    result = image_array.get_current()
+    assert result.min() == 0 and result.max() == 255
+    assert result[..., 2].max() < 255
+
+    image_array = ImageArray(ndarray)
+    AutoLevels(clip=0).process(image_array)
+    result = image_array.get_current()
+    assert (result.min(axis=(0, 1)) == 0).all()
+    assert (result.max(axis=(0, 1)) == 255).all()
+
+    image_array = ImageArray(ndarray)
+    AutoWhiteBalance().process(image_array)
+    means = image_array.get_current().mean(axis=(0, 1))
+    assert means.max() - means.min() < 1
+
+
+def test_auto_levels_table_composes_with_curves():
+    rng = np.random.default_rng(10)
+    ndarray = rng.integers(30, 200, (20, 20, 3), dtype=np.uint8)
+    curves = Curves((0, 0), (100, 60), (160, 210), (255, 255))
+
+    image_array = ImageArray(ndarray)
+    AutoLevels().process(image_array)
+    curves.process(image_array)
+
+    table = compose_luts([AutoLevels().lut_for(ImageArray(ndarray)), curves.lut])
+    expected = apply_lut(table, *np.moveaxis(ndarray, -1, 0))
+    np.testing.assert_equal(image_array.get_current(), np.moveaxis(expected, 0, -1))
+
+
+def test_auto_levels_stack_matches_frames():
+    rng = np.random.default_rng(12)
+    frames = rng.integers(0, 256, (3, 16, 16, 3), dtype=np.uint8)
+    frames[1] //= 3
+
+    image_array = ImageArray(frames, dtype=np.int16)
+    AutoLevels().process(image_array)
+    result = image_array.get_current()
+    for index, frame in enumerate(frames):
+        image_array = ImageArray(frame)
+        AutoLevels().process(image_array)
+        np.testing.assert_equal(result[index], image_array.get_current())
@@ -0,0 +1,180 @@
+import io
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import fimage.fimage
+from fimage.exceptions import FimageException
+from fimage.filters import Brightness, Contrast, Grayscale, Sepia, Sharpen
+from fimage.fimage import FImage
+from fimage.presets import Love
+
+
+@pytest.fixture(params=["JPEG", "PNG"])
+def image_format(request):
+    return request.param
+
+
+@pytest.mark.parametrize("scale", [2, 4, 8])
+def test_preview_is_reduced(image_path, random_array, scale):
+    height, width, _ = random_array.shape
+    image = FImage(image_path, preview=scale)
+    assert image.image.size == (width // scale, height // scale)
+    assert image.image_array.original_array.shape == (
+        height // scale,
+        width // scale,
+        3,
+    )
+
+
+def test_preview_save_renders_full_resolution(image_path, random_array, tmp_path):
+    preview = FImage(image_path, preview=4)
+    preview.apply(Contrast(20))
+    preview.apply(Love(), sharpen=50)
+    preview.save(tmp_path / "preview.png")
+
+    full = FImage(image_path)
+    full.apply(Contrast(20), Love(), Sharpen(50))
+    full.save(tmp_path / "full.png")
+
+    saved = np.array(Image.open(tmp_path / "preview.png"))
+    assert saved.shape == random_array.shape
+    np.testing.assert_equal(saved, np.array(Image.open(tmp_path / "full.png")))
+
+
+def test_invalid_preview_scale(image_path):
+    with pytest.raises(FimageException):
+        FImage(image_path, preview=3)
+
+
+def rendered(image_path, *steps):
+    image = FImage(image_path)
+    for step in steps:
+        image.apply(*step)
+    return np.asarray(image.image)
+
+
+def test_replace_reruns_later_steps(image_path, monkeypatch):
+    image = FImage(image_path, checkpoint_bytes=2**26)
+    image.apply(Contrast(20), Sepia(30))
+    image.apply(Brightness(10))
+    image.apply(Grayscale())
+
+    compiled = []
+    compile_pipeline = fimage.fimage.compile_pipeline
+    monkeypatch.setattr(
+        fimage.fimage,
+        "compile_pipeline",
+        lambda filters: compiled.append(filters) or compile_pipeline(filters),
+    )
+    image.replace(2, Brightness(-10))
+
+    assert [[type(f) for f in filters] for filters in compiled] == [
+        [Brightness],
+        [Grayscale],
+    ]
+    assert image.steps == [2, 3, 4]
+    np.testing.assert_equal(
+        np.asarray(image.image),
+        rendered(
+            image_path, [Contrast(20), Sepia(30)], [Brightness(-10)], [Grayscale()]
+        ),
+    )
+
+
+@pytest.mark.parametrize("checkpoint_bytes", [None, 2**26])
+def test_undo_redo(image_path, checkpoint_bytes):
+    image = FImage(image_path, checkpoint_bytes=checkpoint_bytes)
+    image.apply(Contrast(20))
+    image.apply(Love)
+    image.undo()
+
+    assert len(image.filters) == 1
+    np.testing.assert_equal(
+        np.asarray(image.image), rendered(image_path, [Contrast(20)])
+    )
+
+    image.redo()
+    np.testing.assert_equal(
+        np.asarray(image.image), rendered(image_path, [Contrast(20)], [Love])
+    )
+
+    image.undo()
+    image.undo()
+    with pytest.raises(FimageException):
+        image.undo()
+    np.testing.assert_equal(
+        np.asarray(image.image), np.asarray(FImage(image_path).image)
+    )
+
+    # A new step drops what could be redone
+    image.apply(Sepia())
+    with pytest.raises(FimageException):
+        image.redo()
+
+
+def test_replace_without_checkpoints(image_path):
+    image = FImage(image_path)
+    image.apply(Contrast(20))
+    image.apply(Brightness(10))
+    image.replace(-1, Brightness(-10))
+
+    assert image.checkpoints is None
+    assert image.steps == [1, 2]
+    np.testing.assert_equal(
+        np.asarray(image.image),
+        rendered(image_path, [Contrast(20)], [Brightness(-10)]),
+    )
+
+
+def test_checkpoints_spill_to_memmap(image_path):
+    image = FImage(image_path, checkpoint_bytes=0)
+    image.apply(Contrast(20))
+    image.apply(Sepia())
+
+    assert image.checkpoints.size == 0
+    assert len(list(os.scandir(image.checkpoints.directory))) == 3
+
+    image.undo()
+    np.testing.assert_equal(
+        np.asarray(image.image), rendered(image_path, [Contrast(20)])
+    )
+
+    directory = image.checkpoints.directory
+    image.checkpoints.close()
+    assert not os.path.exists(directory)
+
+
+def test_bytes_in_and_out(image_path):
+    image = FImage(image_path.read_bytes())
+    image.apply(Sepia())
+    data = image.to_bytes(format="PNG")
+
+    expected = FImage(image_path)
+    expected.apply(Sepia())
+    np.testing.assert_equal(np.asarray(Image.open(io.BytesIO(data))), expected.image)
+    assert Image.open(io.BytesIO(image.to_bytes())).format == image.format
+
+
+@pytest.mark.parametrize("channels", [3, 4])
+def test_ndarray_source_is_not_copied(channels):
+    rng = np.random.default_rng(5)
+    ndarray = rng.integers(0, 256, (32, 48, channels), dtype=np.uint8)
+    image = FImage(ndarray)
+    assert image.image_array.original_array is ndarray
+    assert image.image.mode == ("RGBA" if channels == 4 else "RGB")
+
+    image.apply(Contrast(20))
+    # Pillow only stores RGBA pixels in the same layout
+    pixel = image.image.getpixel((0, 0))
+    image.to_ndarray()[0, 0] ^= 1
+    assert (image.image.getpixel((0, 0)) != pixel) == (channels == 4)
+    image.to_ndarray()[0, 0] ^= 1
+    np.testing.assert_equal(
+        np.asarray(Image.open(io.BytesIO(image.to_bytes()))), image.to_ndarray()
+    )
+
+    with pytest.raises(FimageException):
+        FImage(ndarray.astype(np.float32))
@@ -0,0 +1,121 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import fimage.image_array
+from fimage.filters import FillColor, Grayscale, Saturation, Sepia
+from fimage.image_array import ImageArray
+from fimage.pipeline import compile_pipeline
+from fimage.presets import Love, OrangePeel, SinCity
+
+
+def peak_frames(image_array, pipeline):
+    """Peak bytes allocated while running the pipeline, in uint8 frames."""
+    tracemalloc.start()
+    try:
+        pipeline.process(image_array)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / image_array.original_array[..., 0].nbytes
+
+
+def test_buffered_channels_are_views():
+    image_array = ImageArray(np.zeros((4, 5, 4), dtype=np.uint8), dtype=np.int16)
+    FillColor(10, 20, 30).process(image_array)
+
+    assert image_array.buffer.shape == (3, 4, 5)
+    assert np.shares_memory(image_array.R, image_array.buffer)
+    np.testing.assert_equal(image_array.buffer[2], 30)
+    np.testing.assert_equal(image_array.get_current()[..., 3], 0)
+
+
+def test_scratch_is_reused_when_buffered():
+    image_array = ImageArray(np.zeros((4, 5, 3), dtype=np.uint8), dtype=np.int16)
+    first = image_array.scratch("tmp", (4, 5), np.float64)
+    assert image_array.scratch("tmp", (4, 5), np.float64) is first
+    assert image_array.scratch("tmp", (2, 5), np.float64) is not first
+
+    image_array = ImageArray(np.zeros((4, 5, 3), dtype=np.uint8))
+    first = image_array.scratch("tmp", (4, 5), np.float64)
+    assert image_array.scratch("tmp", (4, 5), np.float64) is not first
+
+
+@pytest.mark.parametrize("preset", [Love, OrangePeel, SinCity])
+def test_int16_buffer_matches_default(random_array, preset):
+    default = ImageArray(random_array.copy())
+    buffered = ImageArray(random_array.copy(), dtype=np.int16)
+    compile_pipeline([preset]).process(default)
+    compile_pipeline([preset]).process(buffered)
+    np.testing.assert_equal(buffered.get_current(), default.get_current())
+
+
+def test_float32_buffer_is_close_to_default(random_array):
+    filters = [Sepia(40), Grayscale(), Love]
+    default = ImageArray(random_array.copy())
+    buffered = ImageArray(random_array.copy(), dtype=np.float32)
+    compile_pipeline(filters).process(default)
+    compile_pipeline(filters).process(buffered)
+    diff = np.abs(buffered.get_current().astype(np.int16) - default.get_current())
+    # float32 intermediates only move values sitting on a truncation boundary
+    assert diff.max() <= 4
+    assert np.count_nonzero(diff) / diff.size < 0.01
+
+
+@pytest.mark.parametrize("preset", [Love, OrangePeel, SinCity])
+def test_buffered_preset_peak_memory(random_array, preset):
+    pipeline = compile_pipeline([preset])
+    default = ImageArray(random_array.copy())
+    buffered = ImageArray(random_array.copy(), dtype=np.int16)
+
+    # Warm up so the buffered scratch pool is already populated
+    pipeline.process(default)
+    pipeline.process(buffered)
+
+    default_peak = peak_frames(default, pipeline)
+    buffered_peak = peak_frames(buffered, pipeline)
+
+    # Measured on a 64x48 RGB image: about 44-48 frames for the default
+    # storage and about 10 frames with an int16 buffer
+    assert buffered_peak < 16
+    assert buffered_peak < default_peak / 2
+
+
+@pytest.mark.parametrize(
+    "filter_", [Sepia(), Sepia(40), Grayscale(), Saturation(30), Saturation(-70)]
+)
+@pytest.mark.parametrize("dtype", [None, np.int16])
+def test_fixed_point_is_within_one(random_array, filter_, dtype):
+    default = ImageArray(random_array.copy(), dtype=dtype)
+    fixed = ImageArray(random_array.copy(), dtype=dtype, fixed_point=True)
+    filter_.process(default)
+    filter_.process(fixed)
+
+    diff = fixed.get_current().astype(np.int16) - default.get_current()
+    assert np.abs(diff).max() <= 1
+
+
+def test_fixed_point_default(monkeypatch):
+    ndarray = np.zeros((2, 2, 3), dtype=np.uint8)
+    assert not ImageArray(ndarray).fixed_point
+    monkeypatch.setattr(fimage.image_array, "FIXED_POINT", True)
+    assert ImageArray(ndarray).fixed_point
+    assert not ImageArray(ndarray, fixed_point=False).fixed_point
+    assert ImageArray(ndarray).band(0, 1).fixed_point
+
+
+def test_histograms_are_kept_until_pixels_change(random_array):
+    image_array = ImageArray(random_array, dtype=np.int16)
+    histograms = image_array.histograms(None)
+    np.testing.assert_equal(
+        histograms[1], np.bincount(random_array[..., 1].ravel(), minlength=256)
+    )
+    assert image_array.histograms(None) is histograms
+
+    # Sampled every other row and column
+    sampled = image_array.histograms(random_array[..., 0].size // 4)
+    assert sampled.sum(axis=1).tolist() == [random_array[::2, ::2, 0].size] * 3
+
+    Grayscale().process(image_array)
+    assert image_array.histograms(None) is not histograms
@@ -0,0 +1,47 @@
+import json
+import subprocess
+import sys
+
+# Import `fimage` in a fresh interpreter and report what it pulled in
+IMPORT_SCRIPT = """
+import json, sys, time
+import numpy
+start = time.perf_counter()
+import fimage
+elapsed = time.perf_counter() - start
+from fimage.class_register import ClassMapRegister
+print(json.dumps({
+    "elapsed": elapsed,
+    "modules": sorted(sys.modules),
+    "registered": sorted(ClassMapRegister.class_map),
+}))
+"""
+
+# Time taken by `import fimage` once NumPy is loaded, about 30ms when measured
+IMPORT_BUDGET = 0.5
+
+
+def run_import():
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def test_import_does_not_load_backends():
+    result = run_import()
+    for backend in ("cv2", "PIL", "concurrent.futures", "multiprocessing"):
+        assert backend not in result["modules"]
+
+
+def test_registry_is_populated_on_import():
+    registered = run_import()["registered"]
+    for name in ("sharpen", "contrast", "curves", "sincity", "love", "orangepeel"):
+        assert name in registered
+
+
+def test_import_time():
+    assert run_import()["elapsed"] < IMPORT_BUDGET
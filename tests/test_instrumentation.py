@@ -0,0 +1,70 @@
+import logging
+
+import numpy as np
+import pytest
+
+from fimage.filters import Brightness, Contrast, Sepia, Sharpen
+from fimage.image_array import ImageArray
+from fimage.instrumentation import LoggingSink, MetricsRegistry, instrument
+from fimage.pipeline import compile_pipeline
+from fimage.presets import SinCity
+
+
+@pytest.fixture
+def image_array():
+    rng = np.random.default_rng(3)
+    return ImageArray(rng.integers(0, 256, (64, 48, 4), dtype=np.uint8))
+
+
+def test_records_compiled_stages(image_array):
+    pipeline = compile_pipeline([Contrast(20), Brightness(10), Sharpen(50)])
+    with instrument(memory=False) as records:
+        pipeline.process(image_array)
+
+    assert [record.name for record in records] == [
+        "FusedStage([Contrast, Brightness])",
+        "Sharpen",
+    ]
+    for record in records:
+        assert record.depth == 0
+        assert record.wall_seconds > 0
+        assert record.peak_bytes is None
+        assert record.shape == (64, 48, 4)
+    assert records[0].dtypes_in == ("uint8",) * 3
+    assert records[0].dtypes_out == ("int16",) * 3
+
+
+def test_records_nested_preset_filters(image_array):
+    with instrument() as records:
+        SinCity.process(image_array)
+
+    assert records[-1].name == "SinCity"
+    assert records[-1].depth == 0
+    filters = records[:-1]
+    assert [record.name for record in filters] == [
+        type(filter_).__name__ for filter_ in SinCity.filters
+    ]
+    assert all(record.depth == 1 for record in filters)
+    # The preset's peak covers the peaks of its filters
+    assert records[-1].peak_bytes >= max(record.peak_bytes for record in filters)
+    assert records[-1].peak_bytes > image_array.original_array[..., 0].nbytes
+
+
+def test_disabled_outside_block(image_array):
+    sink = []
+    with instrument(sink.append, memory=False):
+        Sepia().process(image_array)
+    Sepia().process(image_array)
+    assert len(sink) == 1
+
+
+def test_sinks(image_array, caplog):
+    registry = MetricsRegistry()
+    with caplog.at_level(logging.INFO, logger="fimage"):
+        with instrument(registry, LoggingSink()):
+            Sepia().process(image_array)
+            Sepia().process(image_array)
+
+    assert registry.samples["fimage_filter_calls_total"]["Sepia"] == 2
+    assert 'fimage_filter_calls_total{filter="Sepia"} 2' in registry.exposition()
+    assert "Sepia wall=" in caplog.text
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from fimage.filters import (
+    Brightness,
+    Channels,
+    Clip,
+    Colorize,
+    Contrast,
+    Curves,
+    Exposure,
+    Gamma,
+    Invert,
+    Posterize,
+)
+from fimage.lut import IDENTITY, apply_lut, compose_luts, is_lut_index
+
+POINT_FILTERS = [
+    Brightness(20),
+    Channels({"R": 20, "B": -40}),
+    Clip(30),
+    Colorize(196, 32, 7, 30),
+    Contrast(40),
+    Curves((0, 0), (100, 50), (140, 200), (255, 255)),
+    Exposure(10),
+    Gamma(1.3),
+    Invert(),
+    Posterize(80),
+]
+
+
+@pytest.fixture
+def channels():
+    rng = np.random.default_rng(3)
+    return rng.integers(0, 256, (3, 16, 12), dtype=np.int16)
+
+
+@pytest.mark.parametrize("filter_", POINT_FILTERS, ids=lambda f: type(f).__name__)
+def test_lut_matches_transform(filter_, channels):
+    assert filter_.lut.shape == (3, 256)
+    assert filter_.lut.dtype == np.uint8
+    np.testing.assert_equal(
+        apply_lut(filter_.lut, *channels), filter_.transform(channels)
+    )
+
+
+def test_compose_luts(channels):
+    expected = channels
+    for filter_ in POINT_FILTERS:
+        expected = filter_.transform(expected)
+
+    lut = compose_luts(filter_.lut for filter_ in POINT_FILTERS)
+    np.testing.assert_equal(apply_lut(lut, *channels), expected)
+    np.testing.assert_equal(compose_luts([]), IDENTITY)
+
+
+def test_is_lut_index():
+    assert is_lut_index(np.array([0, 255], dtype=np.uint8))
+    assert is_lut_index(np.array([0, 255], dtype=np.int64))
+    assert not is_lut_index(np.array([0, 256], dtype=np.int16))
+    assert not is_lut_index(np.array([-1, 20], dtype=np.int16))
+    assert not is_lut_index(np.array([0.5, 20.0]))
@@ -0,0 +1,168 @@
+import numpy as np
+import pytest
+
+from fimage import pipeline
+from fimage.filters import (
+    BoxBlur,
+    Brightness,
+    ColorMatrix,
+    Contrast,
+    Curves,
+    Edges,
+    Exposure,
+    FillColor,
+    Gamma,
+    GaussianBlur,
+    Grayscale,
+    Invert,
+    Noise,
+    Saturation,
+    Sepia,
+    Sharpen,
+    SwapChannels,
+    UnsharpMask,
+    Vibrance,
+    Vignette,
+)
+from fimage.image_array import ImageArray
+from fimage.pipeline import FusedStage, VibranceSaturation, compile_pipeline
+from fimage.presets import Love, OrangePeel, SinCity
+
+
+def process_serially(ndarray, filters):
+    image_array = ImageArray(ndarray.copy())
+    for filter_ in filters:
+        filter_.process(image_array)
+    return image_array.get_current()
+
+
+def process_compiled(ndarray, filters, workers=1, **kwargs):
+    image_array = ImageArray(ndarray.copy(), **kwargs)
+    compile_pipeline(filters).process(image_array, workers=workers)
+    return image_array.get_current()
+
+
+def test_compile_fuses_adjacent_point_filters():
+    pipeline = compile_pipeline(
+        [Brightness(5), Contrast(10), Sharpen(), Gamma(1.2), Grayscale(), Invert()]
+    )
+    stages = pipeline.stages
+    assert isinstance(stages[0], FusedStage)
+    assert [type(f) for f in stages[0].filters] == [Brightness, Contrast]
+    assert isinstance(stages[1], Sharpen)
+    assert isinstance(stages[2], Gamma)
+    assert isinstance(stages[3], Grayscale)
+    assert isinstance(stages[4], Invert)
+
+
+def test_compile_folds_color_matrices(random_array):
+    filters = [SwapChannels("BGR"), Grayscale(), Sepia(40)]
+    stages = compile_pipeline(filters + [Sepia(), Contrast(5)]).stages
+    # Sepia maps some colors beyond 255, so the next matrix is kept apart
+    assert [type(stage) for stage in stages] == [ColorMatrix, Sepia, Contrast]
+
+    # Only the truncation of the intermediate values is skipped
+    folded = process_compiled(random_array, filters)
+    serial = process_serially(random_array, filters)
+    assert np.abs(folded.astype(int) - serial).max() <= 2
+
+
+def test_compile_expands_presets():
+    pipeline = compile_pipeline([Love])
+    assert isinstance(pipeline.stages[0], FusedStage)
+    assert len(pipeline.stages[0].filters) == 4
+    assert isinstance(pipeline.stages[1], Vibrance)
+
+
+@pytest.mark.parametrize("vibrance", [-100, -30, 0, 60, 250])
+@pytest.mark.parametrize("dtype", [None, np.int16, np.float32])
+def test_vibrance_saturation_matches_serial(random_array, vibrance, dtype):
+    filters = [Vibrance(vibrance), Saturation(-40)]
+    stages = compile_pipeline(filters).stages
+    assert isinstance(stages[0], VibranceSaturation)
+
+    image_array = ImageArray(random_array.copy(), dtype=dtype)
+    compile_pipeline(filters).process(image_array)
+    serial = ImageArray(random_array.copy(), dtype=dtype)
+    for filter_ in filters:
+        filter_.process(serial)
+    np.testing.assert_equal(image_array.get_current(), serial.get_current())
+
+
+def test_vibrance_moving_past_max_is_not_fused():
+    stages = compile_pipeline([Vibrance(-150), Saturation(20)]).stages
+    assert [type(stage) for stage in stages] == [Vibrance, Saturation]
+
+
+@pytest.mark.parametrize("preset", [Love, OrangePeel, SinCity])
+def test_fused_preset_matches_serial(random_array, preset, monkeypatch):
+    # Force several chunks per fused stage
+    monkeypatch.setattr(pipeline, "CHUNK_PIXELS", 500)
+    np.testing.assert_equal(
+        process_compiled(random_array, [preset()]),
+        process_serially(random_array, preset.filters),
+    )
+
+
+def test_fused_stage_after_fill_color(random_array):
+    filters = [
+        FillColor(10, 200, 30),
+        Curves((0, 0), (100, 50), (140, 200), (255, 255)),
+        Gamma(0.8),
+    ]
+    np.testing.assert_equal(
+        process_compiled(random_array, filters),
+        process_serially(random_array, filters),
+    )
+
+
+@pytest.mark.parametrize("workers", [2, 3, 5])
+@pytest.mark.parametrize(
+    "filters",
+    [
+        [Love],
+        [OrangePeel, Sharpen(40)],
+        [Sharpen(80), Contrast(20), Sharpen(30), Grayscale(), SinCity],
+        [FillColor(10, 200, 30), Sharpen(50), Exposure(20)],
+        [GaussianBlur(3), Contrast(10), BoxBlur(2), UnsharpMask(80, 4, 3)],
+        [Vignette(70, 20), Edges(), Sepia()],
+        [Sepia(40), Grayscale(), Contrast(10)],
+        [Vibrance(60), Saturation(-20)],
+    ],
+)
+@pytest.mark.parametrize("dtype", [None, np.int16, np.float32])
+@pytest.mark.parametrize("fixed_point", [False, True])
+def test_banded_matches_serial(
+    random_array, filters, workers, dtype, fixed_point, monkeypatch
+):
+    monkeypatch.setattr(pipeline, "MIN_BAND_ROWS", 4)
+    kwargs = dict(dtype=dtype, fixed_point=fixed_point)
+    np.testing.assert_equal(
+        process_compiled(random_array, filters, workers=workers, **kwargs),
+        process_compiled(random_array, filters, **kwargs),
+    )
+
+
+@pytest.mark.parametrize("workers", [2, 3, 5])
+def test_seeded_noise_does_not_depend_on_bands(random_array, workers, monkeypatch):
+    monkeypatch.setattr(pipeline, "MIN_BAND_ROWS", 4)
+    monkeypatch.setattr("fimage.filters.NOISE_BLOCK_ROWS", 8)
+    chain = [Brightness(10), Noise(20, seed=3), Invert()]
+    expected = process_compiled(random_array, chain)
+    np.testing.assert_equal(process_compiled(random_array, chain, workers), expected)
+
+    other = process_compiled(
+        random_array, [Brightness(10), Noise(20, seed=4), Invert()]
+    )
+    assert (other != expected).any()
+
+
+def test_unbanded_stage_runs_on_whole_image(random_array, monkeypatch):
+    monkeypatch.setattr(pipeline, "MIN_BAND_ROWS", 4)
+    np.random.seed(1)
+    expected = process_compiled(random_array, [Brightness(10), Noise(20), Invert()])
+    np.random.seed(1)
+    result = process_compiled(
+        random_array, [Brightness(10), Noise(20), Invert()], workers=4
+    )
+    np.testing.assert_equal(result, expected)
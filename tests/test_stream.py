@@ -0,0 +1,71 @@
+import threading
+
+import numpy as np
+import pytest
+
+from fimage.filters import Contrast, Sharpen
+from fimage.image_array import ImageArray
+from fimage.pipeline import compile_pipeline
+from fimage.presets import SinCity
+from fimage.stream import FrameStream, process_frames
+
+FILTERS = [Contrast(20), SinCity, Sharpen(40)]
+
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(8)
+    return [rng.integers(0, 256, (36, 64, 3), dtype=np.uint8) for _ in range(6)]
+
+
+def expected(frame):
+    image_array = ImageArray(frame.copy())
+    compile_pipeline(FILTERS).process(image_array)
+    return image_array.get_current()
+
+
+def test_frames_match_single_images(frames):
+    results = list(process_frames(iter(frames), FILTERS))
+    assert len(results) == len(frames)
+    for frame, result in zip(frames, results):
+        np.testing.assert_equal(result, expected(frame))
+
+
+def test_bgr_frames(frames):
+    results = process_frames(
+        (frame[..., ::-1].copy() for frame in frames), FILTERS, bgr=True
+    )
+    for frame, result in zip(frames, results):
+        np.testing.assert_equal(result[..., ::-1], expected(frame))
+
+
+def test_buffers_are_reused(frames):
+    stream = FrameStream(FILTERS)
+    stream.process(frames[0])
+    buffer = stream.image_array.buffer
+    scratch = dict(stream.image_array._scratch)
+
+    np.testing.assert_equal(stream.process(frames[1]), expected(frames[1]))
+    assert stream.image_array.buffer is buffer
+    assert all(
+        stream.image_array._scratch[name] is array for name, array in scratch.items()
+    )
+
+
+def test_stopping_early_ends_threads(frames):
+    before = threading.active_count()
+    stream = FrameStream(FILTERS, queue_size=1)(iter(frames * 10))
+    next(stream)
+    stream.close()
+    assert threading.active_count() == before
+
+
+def test_errors_are_raised_to_the_consumer(frames):
+    def failing():
+        yield frames[0]
+        raise OSError("cannot decode")
+
+    stream = process_frames(failing(), FILTERS)
+    next(stream)
+    with pytest.raises(OSError, match="cannot decode"):
+        next(stream)
@@ -0,0 +1,117 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from fimage.filters import (
+    AutoContrast,
+    AutoLevels,
+    AutoWhiteBalance,
+    Contrast,
+    Noise,
+    Saturation,
+    Sepia,
+    Sharpen,
+)
+from fimage.image_array import ImageArray
+from fimage.pipeline import compile_pipeline
+from fimage.presets import Love
+from fimage.tiled import decode_to_memmap, process_file, process_tiled
+
+FILTERS = [Contrast(10), Sharpen(30), Love]
+
+
+@pytest.fixture(params=[3, 4])
+def channels(request):
+    return request.param
+
+
+def whole(ndarray, filters, **kwargs):
+    image_array = ImageArray(ndarray.copy(), **kwargs)
+    compile_pipeline(filters).process(image_array)
+    return image_array.get_current()
+
+
+@pytest.mark.parametrize("suffix", [".npy", ".tif"])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_tiled_matches_whole_frame(random_array, tmp_path, suffix, workers):
+    path = tmp_path / "image.png"
+    Image.fromarray(random_array).save(path)
+    output = tmp_path / f"output{suffix}"
+
+    result = process_file(path, FILTERS, output, tile_rows=23, workers=workers)
+
+    expected = whole(random_array, FILTERS)
+    np.testing.assert_equal(np.asarray(result), expected)
+    if suffix == ".tif":
+        np.testing.assert_equal(np.array(Image.open(output)), expected)
+    else:
+        np.testing.assert_equal(np.load(output), expected)
+
+
+def test_decode_to_memmap(random_array, tmp_path):
+    Image.fromarray(random_array).save(tmp_path / "image.png")
+    frame = decode_to_memmap(tmp_path / "image.png", tmp_path / "frame.npy", 16)
+    np.testing.assert_equal(np.load(tmp_path / "frame.npy", mmap_mode="r"), frame)
+    np.testing.assert_equal(frame, random_array)
+
+
+def test_peak_memory_is_bounded_by_tile(tmp_path):
+    source = np.lib.format.open_memmap(
+        tmp_path / "source.npy", mode="w+", dtype=np.uint8, shape=(4096, 256, 3)
+    )
+    source[...] = np.arange(256, dtype=np.uint8)[:, None]
+    output = tmp_path / "output.npy"
+    filters = [Sepia(), Contrast(10)]
+    frame_bytes = source[..., 0].nbytes
+
+    tracemalloc.start()
+    try:
+        process_tiled(source, filters, output, tile_rows=64)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # Tiles are 1/64 of the frame, whole frame processing peaks at about 45 frames
+    assert peak < frame_bytes
+    np.testing.assert_equal(np.load(output)[:64], whole(source[:64], filters))
+
+
+def test_seeded_noise_matches_whole_image():
+    rng = np.random.default_rng(8)
+    source = rng.integers(0, 256, (150, 40, 4), dtype=np.uint8)
+    filters = [Noise(30, seed=11), Sharpen()]
+
+    image_array = ImageArray(source.copy())
+    compile_pipeline(filters).process(image_array)
+    output = process_tiled(source, filters, np.empty_like(source), tile_rows=23)
+    np.testing.assert_equal(output, image_array.get_current())
+    # Alpha is left alone
+    np.testing.assert_equal(output[..., 3], source[..., 3])
+
+
+@pytest.mark.parametrize("dtype", [None, np.int16])
+def test_tiled_fixed_point(random_array, dtype):
+    filters = [Sepia(60), Saturation(30)]
+    kwargs = dict(dtype=dtype, fixed_point=True)
+    result = process_tiled(
+        random_array, filters, np.empty_like(random_array), tile_rows=40, **kwargs
+    )
+    np.testing.assert_equal(result, whole(random_array, filters, **kwargs))
+    assert (result != whole(random_array, filters, dtype=dtype)).any()
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_auto_filters_use_whole_image_histograms(tmp_path, workers):
+    # Vertical gradient, which every tile alone would stretch to [0, 255]
+    gradient = np.linspace(60, 180, 150).astype(np.uint8)
+    ndarray = np.repeat(gradient[:, None, None], 90, axis=1)
+    ndarray = np.concatenate([ndarray, ndarray // 2, ndarray - 40], axis=-1)
+    filters = [AutoLevels(), Sharpen(30), AutoContrast(), AutoWhiteBalance()]
+
+    result = process_tiled(
+        ndarray, filters, tmp_path / "output.npy", tile_rows=50, workers=workers
+    )
+    np.testing.assert_equal(np.asarray(result), whole(ndarray, filters))
+    assert not list(tmp_path.glob("tmp*"))